@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Compares the old five sequential eth_* calls of check_bsc_node.py with the
+# batched, concurrent local/upstream queries against the JSON-RPC stand-in of
+# mock_servers.py answering every HTTP request after --latency milliseconds.
+
+import argparse, sys, time, statistics, threading
+
+import requests
+import check_bsc_node
+import mock_servers
+import transport
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark batched JSON-RPC in check_bsc_node.py")
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=50,
+        help="Amount of checks per mode, default value is 50",
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        type=int,
+        default=50,
+        help="Latency of the mock RPC server in milliseconds, default value is 50",
+    )
+    args = parser.parse_args()
+
+    return args
+
+
+def sequential(host, upstream):
+    # What check_bsc_node.py did before batching: one connection per call
+    def call(url, command):
+        return requests.post(
+            url,
+            headers={"Content-Type": "application/json"},
+            json={"jsonrpc": "2.0", "method": command, "params": [], "id": 56},
+            timeout=3,
+        ).json()["result"]
+
+    call(host, "eth_syncing")
+    call(upstream, "eth_syncing")
+    call(host, "net_peerCount")
+    call(host, "eth_blockNumber")
+    call(upstream, "eth_blockNumber")
+
+
+def batched(host, upstream):
+    thread = threading.Thread(target=check_bsc_node.fetch_upstream_block, args=(upstream,))
+    thread.start()
+    check_bsc_node.get_status(host, ["eth_syncing", "net_peerCount", "eth_blockNumber"])
+    thread.join()
+    # A check process starts without open connections
+    transport.close()
+
+
+def pooled(host, upstream):
+    # Same in a resident process, connections stay open between checks
+    thread = threading.Thread(target=check_bsc_node.fetch_upstream_block, args=(upstream,))
+    thread.start()
+    check_bsc_node.get_status(host, ["eth_syncing", "net_peerCount", "eth_blockNumber"])
+    thread.join()
+
+
+def measure(func, count, *args):
+    latencies = []
+    for _ in range(count):
+        t0 = time.monotonic()
+        func(*args)
+        latencies.append(time.monotonic() - t0)
+    latencies.sort()
+    return (
+        statistics.median(latencies) * 1000,
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    )
+
+
+def main():
+    args = parse_args()
+    local = mock_servers.start_http(mock_servers.MockConfig(latency=args.latency))
+    upstream = mock_servers.start_http(mock_servers.MockConfig(latency=args.latency))
+    local_url = f"http://127.0.0.1:{local.server_port}"
+    upstream_url = f"http://127.0.0.1:{upstream.server_port}"
+
+    print(f"{args.count} checks, {args.latency} ms RPC latency")
+    for name, func in (("sequential", sequential), ("batched", batched), ("pooled", pooled)):
+        p50, p99 = measure(func, args.count, local_url, upstream_url)
+        print(f"{name:>10}: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
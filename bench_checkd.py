@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Compares fork-per-check execution with checkd.py, e.g.
+# bench_checkd.py -n 200 -- check_mountpoint -m /
+
+import argparse, sys, os, shutil, subprocess, tempfile, time, statistics
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark checkd.py against fork-per-check")
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=100,
+        help="Amount of check invocations per mode, default value is 100",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        help="Use an already running checkd.py on this socket instead of starting one",
+    )
+    parser.add_argument(
+        "check",
+        nargs=argparse.REMAINDER,
+        help="Check name and its arguments, default value is check_mountpoint -m /",
+    )
+    args = parser.parse_args()
+    if args.check[:1] == ["--"]:
+        args.check = args.check[1:]
+    if not args.check:
+        args.check = ["check_mountpoint", "-m", "/"]
+
+    return args
+
+
+def measure(command, count):
+    latencies = []
+    started = time.monotonic()
+    for _ in range(count):
+        t0 = time.monotonic()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        latencies.append(time.monotonic() - t0)
+    total = time.monotonic() - started
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "rate": count / total,
+    }
+
+
+def start_daemon(sock_path):
+    daemon = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "checkd.py"), "--socket", sock_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while not os.path.exists(sock_path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("checkd.py did not start")
+        time.sleep(0.05)
+    return daemon
+
+
+def main():
+    args = parse_args()
+    check, check_args = args.check[0], args.check[1:]
+    if check.endswith(".py"):
+        check = check[:-3]
+
+    daemon = None
+    tmpdir = tempfile.mkdtemp()
+    sock_path = args.socket or os.path.join(tmpdir, "checkd.sock")
+    if not args.socket:
+        daemon = start_daemon(sock_path)
+
+    try:
+        modes = {
+            "fork-per-check": [sys.executable, os.path.join(HERE, check + ".py")] + check_args,
+            "checkd": [
+                sys.executable,
+                os.path.join(HERE, "checkd_client.py"),
+                "--socket",
+                sock_path,
+                check,
+            ]
+            + check_args,
+        }
+        print(f"{args.count} runs of {' '.join(args.check)}")
+        for mode, command in modes.items():
+            result = measure(command, args.count)
+            print(
+                f"{mode:>16}: p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms, {result['rate']:.1f} checks/sec"
+            )
+    finally:
+        if daemon is not None:
+            daemon.terminate()
+            daemon.wait()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
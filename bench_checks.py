@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# Runs every check script against the local stand-ins of mock_servers.py and
+# reports p50/p99 latency, checks/sec and peak RSS per check, e.g.
+# bench_checks.py -n 50 -l 20 --only bsc,tron
+#
+# Upstreams are pointed at the mocks too, so nothing leaves the host.
+
+import argparse, sys, os, json, queue, shutil, subprocess, tempfile, time, statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_servers
+
+# os.posix_spawn() with file_actions in the launcher needs 3.8, unlike the checks
+assert sys.version_info >= (3, 8), "This script requires Python 3.8 or higher"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Linux carries the peak RSS of a process over fork() and exec(), so children
+# of this process would all report at least its own RSS. Checks are started
+# from small launcher processes instead, which report the child's usage back.
+LAUNCHER = """
+import os, sys, json, time
+devnull = [(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_WRONLY, 0) for fd in (1, 2)]
+for line in sys.stdin:
+    command, env = json.loads(line)
+    started = time.monotonic()
+    pid = os.posix_spawn(command[0], command, env, file_actions=devnull)
+    _, status, usage = os.wait4(pid, 0)
+    elapsed = time.monotonic() - started
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    print(json.dumps([elapsed, code, usage.ru_maxrss]), flush=True)
+"""
+
+# Check script and its arguments, {http} and {redis} are the mock addresses
+CHECKS = {
+    "gaia": ["check_gaia_node.py", "-H", "{http}"],
+    "binance": ["check_binance_node.py", "-H", "{http}"],
+    "minter": ["check_minter_node.py", "-H", "{http}"],
+    "decimalchain_node": ["check_decimalchain_node.py", "-H", "{http}"],
+    "decimalchain_validator": ["check_decimalchain_validator.py", "-H", "{http}"],
+    "decimalchain": ["check_decimalchain.py", "-H", "{http}"],
+    "bsc": ["check_bsc_node.py", "-H", "http://{http}", "-U", "http://{http}", "--upstream-ttl", "0"],
+    "tron": ["check_tron_node.py", "-H", "{http}", "-U", "{http}", "--upstream-ttl", "0"],
+    "monero": ["check_monero_node.py", "-H", "{http}", "-U", "{http}", "--upstream-ttl", "0"],
+    "prizm": ["check_prizm_node.py", "-H", "127.0.0.1", "-U", "127.0.0.1:9976", "--upstream-ttl", "0"],
+    "redis": ["check_redis.py", "-H", "{redis}", "-M", "used_memory,1e9,2e9", "-M", "connected_clients,500,900"],
+    "redis_bigkeys": ["check_redis_bigkeys.py", "-H", "{redis}", "-w", "64MB", "-c", "256MB"],
+    "mountpoint": ["check_mountpoint.py", "-m", "/"],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the check_* scripts against local mock servers")
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=20,
+        help="Amount of runs per check, default value is 20",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Amount of runs of a check at the same time, default value is 1",
+    )
+    parser.add_argument("--only", help=f"Comma separated checks to run, any of {', '.join(CHECKS)}")
+    parser.add_argument("-l", "--latency", type=int, default=0, help="Milliseconds of mock latency, default value is 0")
+    parser.add_argument("-p", "--peers", type=int, default=10, help="Peers in mock responses, default value is 10")
+    parser.add_argument("-k", "--keys", type=int, default=1000, help="Keys in the Redis stand-in, default value is 1000")
+    parser.add_argument("-f", "--fail-rate", type=float, default=0, help="Fraction of mock requests that fail, default value is 0")
+    parser.add_argument(
+        "--failure",
+        choices=mock_servers.FAILURES,
+        default="error",
+        help="How mock requests fail, default value is error",
+    )
+    args = parser.parse_args()
+    if args.only:
+        args.only = args.only.split(",")
+        unknown = [name for name in args.only if name not in CHECKS]
+        if unknown:
+            parser.error(f"Unknown checks {', '.join(unknown)}")
+    else:
+        args.only = list(CHECKS)
+
+    return args
+
+
+class Launcher:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+
+    def run(self, command, env):
+        # Returns (seconds, exit code, peak RSS in KiB) of one run
+        self.proc.stdin.write(json.dumps([command, env]) + "\n")
+        self.proc.stdin.flush()
+        return json.loads(self.proc.stdout.readline())
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def measure(command, env, count, launchers):
+    def run_once(_):
+        launcher = launchers.get()
+        try:
+            return launcher.run(command, env)
+        finally:
+            launchers.put(launcher)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=launchers.qsize()) as executor:
+        results = list(executor.map(run_once, range(count)))
+    total = time.monotonic() - started
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    codes = {}
+    for _, code, _ in results:
+        codes[code] = codes.get(code, 0) + 1
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "rate": count / total,
+        # ru_maxrss is in KiB on Linux
+        "rss": max(rss for _, _, rss in results) / 1024,
+        "codes": codes,
+    }
+
+
+def main():
+    args = parse_args()
+    config = mock_servers.MockConfig(args.latency, args.peers, args.fail_rate, args.failure, args.keys)
+    http = mock_servers.start_http(config)
+    redis_server = mock_servers.start_redis(config)
+    if "prizm" in args.only:
+        try:
+            mock_servers.start_prizm(config)
+        except OSError as ex:
+            print(f"Skipping prizm, can't listen on port 9976: {ex}")
+            args.only.remove("prizm")
+
+    tmpdir = tempfile.mkdtemp()
+    env = dict(os.environ, NAGIOS_CHECKS_STATE_DIR=tmpdir, PYTHONWARNINGS="ignore")
+    addresses = {
+        "http": f"127.0.0.1:{http.server_port}",
+        "redis": f"127.0.0.1:{redis_server.server_address[1]}",
+    }
+
+    print(
+        f"{args.count} runs per check, concurrency {args.concurrency}, {args.latency} ms latency, "
+        f"{args.peers} peers, {args.keys} keys, fail rate {args.fail_rate} ({args.failure})"
+    )
+    launchers = queue.Queue()
+    for _ in range(args.concurrency):
+        launchers.put(Launcher())
+    print(f"{'check':>22} {'p50 ms':>8} {'p99 ms':>8} {'checks/s':>9} {'RSS MiB':>8}  exit codes")
+    try:
+        for name in args.only:
+            script, *check_args = CHECKS[name]
+            command = [sys.executable, os.path.join(HERE, script)] + [arg.format(**addresses) for arg in check_args]
+            result = measure(command, env, args.count, launchers)
+            codes = ", ".join(f"{code}x{count}" for code, count in sorted(result["codes"].items()))
+            print(
+                f"{name:>22} {result['p50']:8.1f} {result['p99']:8.1f} "
+                f"{result['rate']:9.1f} {result['rss']:8.1f}  {codes}"
+            )
+    finally:
+        while not launchers.empty():
+            launchers.get().close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
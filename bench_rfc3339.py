@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Compares rfc3339.parse_age() with the dateutil round-trip the Tendermint
+# checks used before, on latest_block_time values as nodes return them.
+
+import argparse, sys, os, subprocess, timeit
+from datetime import datetime
+
+import dateutil.parser
+import rfc3339
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+TIMESTAMPS = [
+    "2023-05-01T12:34:56.123456789Z",
+    "2023-05-01T12:35:02.870311554Z",
+    "2024-01-17T08:02:41.011220311Z",
+    "2024-01-17T08:02:47.5Z",
+    "2024-06-30T23:59:59.999999999Z",
+    "2024-06-30T23:59:59Z",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark RFC3339 block time parsing")
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=20000,
+        help="Amount of parsed timestamps per variant, default value is 20000",
+    )
+    args = parser.parse_args()
+
+    return args
+
+
+def dateutil_round_trip(value):
+    latest_block_time = dateutil.parser.parse(
+        datetime.strftime(dateutil.parser.parse(value), "%Y-%m-%dT%H:%M:%S")
+    )
+    return latest_block_time, datetime.utcnow() - latest_block_time
+
+
+def import_time(module):
+    # Best of a few fresh interpreters, minus the bare interpreter startup
+    def run(code):
+        return min(
+            timeit.repeat(
+                lambda: subprocess.run([sys.executable, "-c", code], check=True),
+                number=1,
+                repeat=5,
+            )
+        )
+
+    return run(f"import {module}") - run("pass")
+
+
+def main():
+    args = parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    rounds = max(1, args.count // len(TIMESTAMPS))
+
+    for name, func in (("dateutil", dateutil_round_trip), ("rfc3339", rfc3339.parse_age)):
+        elapsed = timeit.timeit(
+            lambda: [func(value) for value in TIMESTAMPS], number=rounds
+        )
+        per_call = elapsed / (rounds * len(TIMESTAMPS)) * 1e6
+        print(f"{name:>9}: {per_call:.2f} us per timestamp")
+
+    for module in ("dateutil.parser", "rfc3339"):
+        print(f"{module:>16}: {import_time(module) * 1000:.1f} ms import time")
+
+
+if __name__ == "__main__":
+    main()
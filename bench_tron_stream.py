@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Compares the streaming getnodeinfo scan of check_tron_node.py with loading
+# the whole document, on a recorded response (--fixture) or a synthetic one
+# shaped like a well-connected FullNode.
+
+import argparse, sys, io, json, time, tracemalloc
+
+import check_tron_node
+import mock_servers
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark streaming getnodeinfo parsing")
+    parser.add_argument("-f", "--fixture", help="Recorded /wallet/getnodeinfo response")
+    parser.add_argument(
+        "-p",
+        "--peers",
+        type=int,
+        default=3000,
+        help="Amount of peers in the synthetic response, default value is 3000",
+    )
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=10,
+        help="Amount of parses per variant, default value is 10",
+    )
+    args = parser.parse_args()
+
+    return args
+
+
+def full_parse(body):
+    status = json.loads(body)
+    block = check_tron_node.parse_block(status["block"])
+    return block, sum(1 for peer in status["peerList"] if peer["active"])
+
+
+def streaming_parse(body):
+    reader = io.BytesIO(body)
+    return check_tron_node.scan_nodeinfo(iter(lambda: reader.read(65536), b""))
+
+
+def measure(func, body, count):
+    # The body is handed over as it would arrive, so only the parse is counted
+    tracemalloc.start()
+    result = func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(count):
+        func(body)
+    return result, peak, (time.perf_counter() - started) / count
+
+
+def main():
+    args = parse_args()
+    if args.fixture:
+        with open(args.fixture, "rb") as f:
+            body = f.read()
+    else:
+        body = json.dumps(mock_servers.tron_nodeinfo(args.peers)).encode()
+
+    print(f"getnodeinfo body: {len(body) / 1024:.0f} KiB")
+    for name, func in (("full json", full_parse), ("streaming", streaming_parse)):
+        result, peak, elapsed = measure(func, body, args.count)
+        print(
+            f"{name:>9}: block {result[0]}, {result[1]} active peers, "
+            f"peak {peak / 1024:.0f} KiB, {elapsed * 1000:.1f} ms per parse"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+# Resident tracker of the latest block of Tendermint nodes. It subscribes to
+# new block headers over the node's /websocket, keeps height, block time and
+# catching_up per host and saves them to a state file on every block and
+# heartbeat. Checks run with --tracker answer from that file instead of
+# polling /status, as long as the tracker keeps it fresh.
+#
+# While the subscription is down the tracker polls /status and reconnects
+# with exponential backoff. Targets are the addresses the checks are run
+# with, optionally followed by the Tendermint RPC address when it differs,
+# e.g. for Minter whose API and RPC ports are not the same:
+#
+#   blocktracker.py 10.0.0.5:26657 10.0.0.6:8843=10.0.0.6:26657
+
+import argparse, sys, os, json, time, random, base64, hashlib, logging, select, signal, socket, ssl, struct, threading
+import urllib.parse
+
+import statefile
+import transport
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_BACKOFF = 60
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--tracker",
+        action="store_true",
+        help="Answer from the block state kept by blocktracker.py when it is fresh, poll the node otherwise",
+    )
+    parser.add_argument(
+        "--tracker-max-age",
+        type=float,
+        default=15,
+        help="Seconds after which the state of blocktracker.py counts as stale, default value is 15",
+    )
+
+
+def read_sync_info(args, host):
+    # sync_info of /status from the tracker, None when --tracker isn't given
+    # or the tracker hasn't refreshed the state in time
+    if not args.tracker:
+        return None
+    state = statefile.read_json(statefile.state_path("blocks", host))
+    if state is None or state["catching_up"] is None or time.time() - state["updated"] > args.tracker_max_age:
+        return None
+    return {
+        "latest_block_height": state["height"],
+        "latest_block_time": state["time"],
+        "catching_up": state["catching_up"],
+    }
+
+
+def read_status(args, host):
+    # Same as read_sync_info, shaped like the Tendermint /status response
+    sync_info = read_sync_info(args, host)
+    return sync_info and {"result": {"sync_info": sync_info}}
+
+
+class WebSocket:
+    # Just enough of RFC 6455 for a JSON-RPC subscription: client handshake,
+    # masked frames out, fragmented messages and control frames in.
+
+    def __init__(self, url, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        port = parsed.port or (443 if parsed.scheme == "wss" else 80)
+        self.sock = socket.create_connection((parsed.hostname, port), timeout)
+        if parsed.scheme == "wss":
+            context = ssl.create_default_context()
+            self.sock = context.wrap_socket(self.sock, server_hostname=parsed.hostname)
+        self.buffer = b""
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall(
+            (
+                f"GET {parsed.path or '/'} HTTP/1.1\r\n"
+                f"Host: {parsed.netloc}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            ).encode()
+        )
+        while b"\r\n\r\n" not in self.buffer:
+            self.fill()
+        head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        status, *lines = head.decode(errors="replace").split("\r\n")
+        if status.split()[1:2] != ["101"]:
+            raise ConnectionError(f"Websocket handshake failed: {status}")
+        headers = {}
+        for line in lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+        if headers.get("sec-websocket-accept") != accept:
+            raise ConnectionError("Websocket handshake failed: wrong Sec-WebSocket-Accept")
+
+    def close(self):
+        try:
+            self.send(OP_CLOSE, b"")
+        except OSError:
+            pass
+        self.sock.close()
+
+    def fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError("Websocket closed by the server")
+        self.buffer += data
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            self.fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def wait(self, timeout):
+        # True when a frame can be read
+        return bool(self.buffer) or bool(select.select([self.sock], [], [], timeout)[0])
+
+    def send(self, opcode, payload):
+        mask = os.urandom(4)
+        size = len(payload)
+        if size < 126:
+            header = struct.pack(">BB", 0x80 | opcode, 0x80 | size)
+        elif size < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, size)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, size)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+
+    def send_json(self, data):
+        self.send(OP_TEXT, json.dumps(data).encode())
+
+    def read_frame(self):
+        first, second = self.read_exact(2)
+        size = second & 0x7F
+        if size == 126:
+            size = struct.unpack(">H", self.read_exact(2))[0]
+        elif size == 127:
+            size = struct.unpack(">Q", self.read_exact(8))[0]
+        mask = self.read_exact(4) if second & 0x80 else None
+        payload = self.read_exact(size)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return first & 0x80, first & 0x0F, payload
+
+    def recv(self):
+        # Returns the next complete message, None for control frames
+        message = b""
+        while True:
+            fin, opcode, payload = self.read_frame()
+            if opcode == OP_CLOSE:
+                raise ConnectionError("Websocket closed by the server")
+            if opcode == OP_PING:
+                self.send(OP_PONG, payload)
+                return None
+            if opcode == OP_PONG:
+                return None
+            message += payload
+            if fin:
+                return message
+
+
+class Tracker:
+    def __init__(self, key, rpc, args):
+        self.key = key
+        self.args = args
+        self.path = statefile.state_path("blocks", key)
+        secure = rpc.startswith("https://")
+        address = rpc.split("://", 1)[-1].rstrip("/")
+        self.status_url = f"{'https' if secure else 'http'}://{address}/status"
+        self.websocket_url = f"{'wss' if secure else 'ws'}://{address}/websocket"
+        self.state = {"height": None, "time": None, "catching_up": None, "updated": 0, "source": None}
+        self.backoff = 1
+
+    def save(self, source):
+        self.state["updated"] = time.time()
+        self.state["source"] = source
+        if self.state["height"] is not None:
+            statefile.write_json(self.path, self.state)
+
+    def update(self, height, block_time, source):
+        # Events and polls can arrive out of order, never go back in height
+        if self.state["height"] is None or int(height) >= int(self.state["height"]):
+            self.state["height"], self.state["time"] = str(height), block_time
+        self.save(source)
+
+    def poll(self):
+        try:
+            sync_info = transport.get(self.status_url, timeout=self.args.timeout).json()["result"]["sync_info"]
+        except Exception as ex:
+            logging.warning(f"{self.key}: polling {self.status_url} failed: {ex}")
+            return
+        self.state["catching_up"] = sync_info["catching_up"]
+        self.update(sync_info["latest_block_height"], sync_info["latest_block_time"], "poll")
+
+    def subscribe(self):
+        # Runs until the subscription fails
+        ws = WebSocket(self.websocket_url, self.args.timeout)
+        try:
+            ws.send_json(
+                {
+                    "jsonrpc": "2.0",
+                    "method": "subscribe",
+                    "id": 1,
+                    "params": {"query": f"tm.event='{self.args.event}'"},
+                }
+            )
+            # catching_up only comes with /status, refreshed every --status-interval
+            self.poll()
+            last_frame = last_status = time.monotonic()
+            logging.info(f"{self.key}: subscribed to {self.args.event} on {self.websocket_url}")
+            self.backoff = 1
+            while True:
+                if ws.wait(self.args.heartbeat):
+                    message = ws.recv()
+                    last_frame = time.monotonic()
+                    if message is not None:
+                        self.handle(json.loads(message))
+                else:
+                    if time.monotonic() - last_frame > 3 * self.args.heartbeat:
+                        raise ConnectionError("No data from the websocket, not even pongs")
+                    ws.send(OP_PING, b"")
+                    self.save("websocket")
+                if time.monotonic() - last_status >= self.args.status_interval:
+                    last_status = time.monotonic()
+                    self.poll()
+        finally:
+            ws.close()
+
+    def handle(self, message):
+        if "error" in message:
+            raise ConnectionError(f"Subscription failed: {message['error']}")
+        value = message.get("result", {}).get("data", {}).get("value")
+        if not value:
+            # The empty result confirming the subscription
+            return
+        # NewBlockHeader carries the header, NewBlock the whole block
+        header = value.get("header") or value["block"]["header"]
+        logging.debug(f"{self.key}: block {header['height']} at {header['time']}")
+        self.update(header["height"], header["time"], "websocket")
+
+    def run(self):
+        while True:
+            try:
+                self.subscribe()
+            except (OSError, ValueError, KeyError) as ex:
+                logging.warning(f"{self.key}: subscription failed: {ex}")
+            # Poll until the next attempt, the wait doubles on every failure
+            delay = self.backoff * random.uniform(0.5, 1)
+            deadline = time.monotonic() + delay
+            logging.info(f"{self.key}: polling, reconnecting in {delay:.1f}s")
+            while True:
+                self.poll()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(self.args.poll_interval, remaining))
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keep the latest block of Tendermint nodes for the checks run with --tracker")
+    parser.add_argument(
+        "targets",
+        nargs="+",
+        help="Node address as given to the checks with -H, optionally followed by =RPC address, e.g. 127.0.0.1:26657, 10.0.0.6:8843=10.0.0.6:26657, 10.0.0.7:443=https://rpc.domain.com",
+    )
+    parser.add_argument(
+        "--event",
+        choices=("NewBlockHeader", "NewBlock"),
+        default="NewBlockHeader",
+        help="Event to subscribe to, NewBlock sends the whole block, default value is NewBlockHeader",
+    )
+    parser.add_argument(
+        "--heartbeat",
+        type=float,
+        default=5,
+        help="Seconds between pings and state refreshes without new blocks, default value is 5",
+    )
+    parser.add_argument(
+        "--status-interval",
+        type=float,
+        default=30,
+        help="Seconds between /status requests for catching_up, default value is 30",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5,
+        help="Seconds between /status requests while the subscription is down, default value is 5",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=10,
+        help="Timeout of connections and requests in seconds, default value is 10",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    args = parser.parse_args()
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.debug:
+        logging.basicConfig(
+            format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+            level=logging.DEBUG,
+        )
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            level=logging.INFO,
+        )
+
+    for target in args.targets:
+        key, _, rpc = target.partition("=")
+        tracker = Tracker(key, rpc or key, args)
+        threading.Thread(target=tracker.run, name=key, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
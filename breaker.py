@@ -0,0 +1,91 @@
+# Circuit breaker per HTTP origin, shared by all check processes through the
+# state directory. After NAGIOS_CHECKS_BREAKER_FAILURES failed requests in a
+# row (connection errors and timeouts, not HTTP error statuses) the origin is
+# open: requests to it fail at once with the last error instead of waiting
+# for their timeout again. When the backoff is over a single request is let
+# through as a probe (half-open). It closes the breaker on success, otherwise
+# the breaker opens again with twice the backoff, up to
+# NAGIOS_CHECKS_BREAKER_MAX_BACKOFF seconds.
+
+import os, time, random, logging
+import statefile
+
+FAILURES = int(os.environ.get("NAGIOS_CHECKS_BREAKER_FAILURES", 3))
+BACKOFF = float(os.environ.get("NAGIOS_CHECKS_BREAKER_BACKOFF", 30))
+MAX_BACKOFF = float(os.environ.get("NAGIOS_CHECKS_BREAKER_MAX_BACKOFF", 600))
+CLOSED = {"state": "closed", "failures": 0}
+
+
+class CircuitOpen(ConnectionError):
+    pass
+
+
+def get_path(origin):
+    return statefile.state_path("breaker", origin)
+
+
+def describe(origin, entry, now):
+    return (
+        f"{origin} is failing, {entry['failures']} failures in a row, last: {entry['error']}, "
+        f"next probe in {max(0, entry['until'] - now):.0f}s"
+    )
+
+
+def before(origin):
+    # Raises CircuitOpen while the origin is open or another process probes it
+    if FAILURES <= 0:
+        return
+    path = get_path(origin)
+    entry = statefile.read_json(path)
+    if entry is None or entry["state"] == "closed":
+        return
+    now = time.time()
+    if now < entry["until"]:
+        raise CircuitOpen(describe(origin, entry, now))
+    with statefile.locked(path):
+        entry = statefile.read_json(path)
+        now = time.time()
+        if entry is None or entry["state"] == "closed":
+            return
+        if now < entry["until"]:
+            raise CircuitOpen(describe(origin, entry, now))
+        # This request is the probe, the others keep failing fast until it
+        # reports back or, if it never does, until another backoff has passed
+        entry.update(state="half-open", until=now + entry["backoff"])
+        statefile.write_json(path, entry)
+    logging.debug(f"{origin}: probing after {entry['failures']} failures")
+
+
+def success(origin):
+    if FAILURES <= 0:
+        return
+    path = get_path(origin)
+    # Unlocked fast path for the usual case of a healthy origin
+    if statefile.read_json(path) in (None, CLOSED):
+        return
+    with statefile.locked(path):
+        entry = statefile.read_json(path)
+        if entry is None or entry == CLOSED:
+            return
+        statefile.write_json(path, CLOSED)
+    if entry["state"] != "closed":
+        logging.debug(f"{origin}: closed after {entry['failures']} failures")
+
+
+def failure(origin, error):
+    if FAILURES <= 0:
+        return
+    path = get_path(origin)
+    with statefile.locked(path):
+        entry = statefile.read_json(path) or dict(CLOSED)
+        entry["failures"] += 1
+        entry["error"] = str(error)[:200]
+        # A failed probe doubles the backoff. Requests that were already on
+        # their way when the breaker opened only add to the count.
+        if entry["state"] == "half-open" or (entry["state"] == "closed" and entry["failures"] >= FAILURES):
+            backoff = BACKOFF if entry["state"] == "closed" else min(entry["backoff"] * 2, MAX_BACKOFF)
+            # Jitter keeps the probes of many origins from lining up
+            until = time.time() + backoff * random.uniform(0.8, 1)
+            entry.update(state="open", backoff=backoff, until=until)
+            logging.debug(f"{origin}: open for {backoff:.0f}s after {entry['failures']} failures")
+        statefile.write_json(path, entry)
@@ -1,8 +1,25 @@
 #!/usr/bin/env python3
 
-import argparse, sys, requests, logging
-
-assert sys.version_info >= (3, 6), "This script requires Python 3.6 or higher"
+import profiling
+import argparse, sys, logging
+import transport
+import timing
+import deadline
+import response_cache
+import upstream_quorum
+import heighthist
+from concurrent.futures import ThreadPoolExecutor
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+# Public BSC endpoints, asked in this order
+UPSTREAMS = [
+    "https://bsc-dataseed2.binance.org",
+    "https://bsc-dataseed1.binance.org",
+    "https://bsc-dataseed3.binance.org",
+    "https://bsc-dataseed4.binance.org",
+]
+UPSTREAM_BUDGET = 3
 
 
 def parse_args():
@@ -14,13 +31,6 @@ def parse_args():
         help="Hostname or IP address of the node to check, e.g. 127.0.0.1:8545, domain.com:8080, default value is 127.1:8545",
     )
 
-    parser.add_argument(
-        "-U",
-        "--upstream",
-        default="https://bsc-dataseed2.binance.org",
-        help="Hostname or IP address of the upstream node to check against, e.g. 127.0.0.1:8545, domain.com:8080, default value is https://bsc-dataseed2.binance.org",
-    )
-
     parser.add_argument(
         "-t",
         "--delta",
@@ -38,28 +48,70 @@ def parse_args():
         help="Minimal amount of connected peers, default value is 3",
     )
 
+    parser.add_argument(
+        "--upstream-ttl",
+        type=int,
+        default=5,
+        help="Seconds to share the upstream block height between checks, 0 disables the cache, default value is 5 sec",
+    )
+
+    upstream_quorum.add_arguments(parser, UPSTREAMS, UPSTREAM_BUDGET)
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["rpc"])
+    heighthist.add_arguments(parser)
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
 
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
     return args
 
 
-def get_status(host, command):
+def fetch_status(host, commands, timeout=3, cache_ttl=0):
+    # All commands go out as one JSON-RPC batch, results come back in order
     if not host.startswith("http://") and not host.startswith("https://"):
         host = f"http://{host}"
+    batch = [
+        {"jsonrpc": "2.0", "method": command, "params": [], "id": i}
+        for i, command in enumerate(commands)
+    ]
+    status = transport.post(
+        f"{host}",
+        headers={"Content-Type": "application/json"},
+        json=batch,
+        timeout=timeout,
+        cache_ttl=cache_ttl,
+    )
+    replies = {reply["id"]: reply for reply in status.json()}
+    return [replies[i]["result"] for i in range(len(commands))]
+
+
+def get_status(host, commands, cache_ttl=0):
     try:
-        status = requests.post(
-            f"{host}",
-            headers={"Content-Type": "application/json"},
-            json={"jsonrpc": "2.0", "method": command, "params": [], "id": 56},
-            timeout=3,
-        )
+        return fetch_status(host, commands, cache_ttl=cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         logging.info(f"CRITICAL - {ex}")
         sys.exit(2)
 
-    return status.json()
+
+def fetch_upstream_block(upstream_host, timeout=3):
+    upstream_is_catching_up, upstream_block = fetch_status(
+        upstream_host, ["eth_syncing", "eth_blockNumber"], timeout
+    )
+    logging.debug(f"upstream_is_catching_up:{upstream_is_catching_up}")
+    return int(upstream_block, 16)
+
+
+def get_upstream_block(args):
+    try:
+        return upstream_quorum.get_args_height(args, fetch_upstream_block)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
+    except Exception as ex:
+        logging.info(f"CRITICAL - {ex}")
+        sys.exit(2)
 
 
 def main():
@@ -76,40 +128,54 @@ def main():
             level=logging.INFO,
         )
 
+    deadline.start(args.deadline)
     host = args.host
-    upstream_host = args.upstream
     delta = args.delta
-    is_catching_up = get_status(host, "eth_syncing")["result"]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        upstream = executor.submit(get_upstream_block, args)
+        with deadline.phase("status"):
+            is_catching_up, peers, block = get_status(
+                host,
+                ["eth_syncing", "net_peerCount", "eth_blockNumber"],
+                response_cache.get_ttl(args, "rpc"),
+            )
+        upstream_block, cache_info, quorum_info = upstream.result()
     logging.debug(f"is_catching_up:{is_catching_up}")
-    upstream_is_catching_up = get_status(upstream_host, "eth_syncing")["result"]
-    logging.debug(f"upstream_is_catching_up:{upstream_is_catching_up}")
-    peers = int(get_status(host, "net_peerCount")["result"], 16)
+    peers = int(peers, 16)
     logging.debug(f"peers:{peers}")
-    block = int(get_status(host, "eth_blockNumber")["result"], 16)
+    block = int(block, 16)
     logging.debug(f"block:{block}")
-    upstream_block = int(get_status(upstream_host, "eth_blockNumber")["result"], 16)
-    logging.debug(f"upstream_block:{upstream_block}")
+    logging.debug(f"upstream_block:{upstream_block}, cache:{cache_info}, quorum:{quorum_info}")
+    transport.log_stats()
     delay = upstream_block - block
-    state = f"Current block: {block}, Upstream block: {upstream_block}"
+    state = f"Current block: {block}, Upstream block: {upstream_block} ({upstream_quorum.describe(cache_info, quorum_info)})"
+    if args.history:
+        trend = heighthist.record(
+            f"bsc:{host}", block, upstream_block, args.history_window, delta
+        )
+        logging.debug(f"trend:{trend}")
+        state += f", {heighthist.describe(trend)}"
     peers_state = f"Only {peers} peers connected! "
 
     if delay >= delta:
-        logging.info(f"CRITICAL - delta is {delay} blocks. {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - delta is {delay} blocks. {state}"))
         sys.exit(2)
     elif peers < args.peers:
-        logging.info(f"CRITICAL - {peers_state}, {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - {peers_state}, {state}"))
         sys.exit(2)
     elif delay < delta:
-        logging.info(f"OK - {state}, Delta: {delay}")
+        logging.info(timing.append_perfdata(f"OK - {state}, Delta: {delay}"))
         sys.exit(0)
     elif is_catching_up != False:
         logging.info(
-            f"CRITICAL - Node is catching up: {is_catching_up}, current block: {block}, upstream block: {upstream_block}, Delta: {delay}"
+            timing.append_perfdata(
+                f"CRITICAL - Node is catching up: {is_catching_up}, current block: {block}, upstream block: {upstream_block}, Delta: {delay}"
+            )
         )
     else:
-        logging.info(f"CRITICAL - {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - {state}"))
         sys.exit(2)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Node and validator health of a DecimalChain validator from one /status and
+# one /net_info request, fetched concurrently.
+
+import profiling
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import check_decimalchain_node
+import deadline
+import response_cache
+import heighthist
+import multihost
+import timing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-H",
+        "--host",
+        default="127.1:26657",
+        help="Hostname or IP address of the node to check, e.g. 127.0.0.1:8841, domain.com:1234, default value is 127.1:26657",
+    )
+    parser.add_argument(
+        "-t",
+        "--delta",
+        "--delay",
+        type=int,
+        default=30,
+        help="Time Delay (Delta) between server's time and latest block time, default value is 30",
+    )
+    parser.add_argument(
+        "-p",
+        "--peers",
+        type=int,
+        default=3,
+        help="Minimal amount of connected peers, default value is 3",
+    )
+    heighthist.add_arguments(parser)
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["status", "net_info"])
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+def get_status_and_netinfo(host, args):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Phases are per thread, the fetches open their own
+        status = executor.submit(
+            deadline.phased("status", check_decimalchain_node.fetch_status),
+            host,
+            response_cache.get_ttl(args, "status"),
+        )
+        netinfo = executor.submit(
+            deadline.phased("net_info", check_decimalchain_node.fetch_netinfo),
+            host,
+            response_cache.get_ttl(args, "net_info"),
+        )
+        try:
+            return status.result(), netinfo.result()
+        except deadline.DeadlineExceeded as ex:
+            deadline.fail(ex)
+        except Exception as ex:
+            print("CRITICAL - " + str(ex))
+            sys.exit(2)
+
+
+def evaluate_validator(status):
+    catching_up = status["result"]["sync_info"]["catching_up"]
+    votingpower = int(status["result"]["validator_info"]["voting_power"])
+    state = f"Voting power: {votingpower}, Is catching up: {catching_up}"
+
+    if catching_up != False:
+        return 2, "CRITICAL - Status: Catching up " + state
+    elif votingpower > 0:
+        return 0, "OK - Status: Validating " + state
+    else:
+        return 2, "CRITICAL - Status: DOWN " + state
+
+
+def main():
+    args = parse_args()
+    deadline.start(args.deadline)
+    status, netinfo = get_status_and_netinfo(args.host, args)
+
+    results = [
+        ("Node", check_decimalchain_node.evaluate(args, status, netinfo, args.host, "decimalchain_full")),
+        ("Validator", evaluate_validator(status)),
+    ]
+    code = multihost.worst([result[0] for _, result in results])
+    summary = ", ".join(f"{aspect}: {multihost.STATES[result[0]]}" for aspect, result in results)
+    print(timing.append_perfdata(f"{multihost.STATES[code]} - {summary}"))
+    for aspect, (_, message) in results:
+        print(f"{aspect}: {message}")
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -1,11 +1,16 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import profiling
 import sys
-import requests
+import transport
+import timing
+import deadline
+import response_cache
 import argparse
-from datetime import datetime
-import dateutil.parser
+import rfc3339
+import multihost
+import heighthist
 
 
 def parse_args():
@@ -31,60 +36,94 @@ def parse_args():
         default=3,
         help="Minimal amount of connected peers, default value is 3",
     )
+    multihost.add_arguments(parser)
+    heighthist.add_arguments(parser)
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["status", "net_info"])
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def get_status(host):
+def fetch_status(host, cache_ttl=0):
+    return transport.get("http://" + host + "/status", timeout=5, cache_ttl=cache_ttl).json()
+
+
+def fetch_netinfo(host, cache_ttl=0):
+    return transport.get("http://" + host + "/net_info", timeout=5, cache_ttl=cache_ttl).json()
+
+
+def get_status(host, cache_ttl=0):
     try:
-        status = requests.get("http://" + host + "/status", timeout=5)
+        return fetch_status(host, cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         print("CRITICAL - " + str(ex))
         sys.exit(2)
 
-    return status.json()
-
 
-def get_netinfo(host):
+def get_netinfo(host, cache_ttl=0):
     try:
-        netinfo = requests.get("http://" + host + "/net_info", timeout=5)
+        return fetch_netinfo(host, cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         print("CRITICAL - " + str(ex))
         sys.exit(2)
 
-    return netinfo.json()
-
-
-def main():
-    args = parse_args()
-    status = get_status(args.host)
-    netinfo = get_netinfo(args.host)
 
+def evaluate(args, status, netinfo, host=None, history_prefix="decimalchain"):
+    # history_prefix keeps the height history apart from other scripts
+    # evaluating the same host
     npeers = int(netinfo["result"]["n_peers"])
-    latest_block_time = dateutil.parser.parse(
-        datetime.strftime(
-            dateutil.parser.parse(status["result"]["sync_info"]["latest_block_time"]),
-            "%Y-%m-%dT%H:%M:%S",
-        )
+    latest_block_time, delta = rfc3339.parse_age(
+        status["result"]["sync_info"]["latest_block_time"]
     )
     latest_block_height = status["result"]["sync_info"]["latest_block_height"]
-    delta = datetime.utcnow().replace(microsecond=0) - latest_block_time
-    state = f"Latest block: {latest_block_height}, Latest block time: {latest_block_time}, delta: {delta}, Peers connected: {npeers}"
+    state = f"Latest block: {latest_block_height}, Latest block time: {latest_block_time:%Y-%m-%d %H:%M:%S}, delta: {delta}, Peers connected: {npeers}"
+    if args.history and host:
+        trend = heighthist.record(
+            f"{history_prefix}:{host}", latest_block_height, window=args.history_window
+        )
+        state += ", " + heighthist.describe(trend)
     npeersstate = f"Only {npeers} peers connected!, "
 
     if npeers < args.peers:
-        print("CRITICAL - Status: " + npeersstate + state)
-        sys.exit(2)
-    elif delta.seconds >= args.delta:
-        print("CRITICAL - Status: Delta is too big!, " + state)
-        sys.exit(2)
-    elif delta.seconds < args.delta:
-        print("OK - Status: " + state)
-        sys.exit(0)
+        return 2, "CRITICAL - Status: " + npeersstate + state
+    elif delta.total_seconds() >= args.delta:
+        return 2, "CRITICAL - Status: Delta is too big!, " + state
+    elif delta.total_seconds() < args.delta:
+        return 0, "OK - Status: " + state
     else:
-        print("CRITICAL - Status: " + state)
-        sys.exit(2)
+        return 2, "CRITICAL - Status: " + state
+
+
+def main():
+    args = parse_args()
+    deadline.start(args.deadline)
+    hosts = multihost.get_hosts(args)
+    if hosts:
+        multihost.run(
+            lambda host: evaluate(
+                args,
+                fetch_status(host, response_cache.get_ttl(args, "status")),
+                fetch_netinfo(host, response_cache.get_ttl(args, "net_info")),
+                host,
+            ),
+            hosts,
+            args.concurrency,
+            args.aggregate,
+        )
+
+    with deadline.phase("status"):
+        status = get_status(args.host, response_cache.get_ttl(args, "status"))
+    with deadline.phase("net_info"):
+        netinfo = get_netinfo(args.host, response_cache.get_ttl(args, "net_info"))
+    code, message = evaluate(args, status, netinfo, args.host)
+    print(timing.append_perfdata(message))
+    sys.exit(code)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
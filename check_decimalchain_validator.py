@@ -1,11 +1,14 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import profiling
 import sys
-import requests
+import transport
+import timing
+import deadline
+import response_cache
 import argparse
-from datetime import datetime
-import dateutil.parser
+import rfc3339
 
 
 def parse_args():
@@ -31,13 +34,18 @@ def parse_args():
         default=3,
         help="Minimal amount of connected peers, default value is 3",
     )
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["status", "net_info"])
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def get_status(host):
+def get_status(host, cache_ttl=0):
     try:
-        status = requests.get("http://" + host + "/status", timeout=5)
+        status = transport.get("http://" + host + "/status", timeout=5, cache_ttl=cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         print("CRITICAL - " + str(ex))
         sys.exit(2)
@@ -45,9 +53,11 @@ def get_status(host):
     return status.json()
 
 
-def get_netinfo(host):
+def get_netinfo(host, cache_ttl=0):
     try:
-        netinfo = requests.get("http://" + host + "/net_info", timeout=5)
+        netinfo = transport.get("http://" + host + "/net_info", timeout=5, cache_ttl=cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         print("CRITICAL - " + str(ex))
         sys.exit(2)
@@ -57,46 +67,44 @@ def get_netinfo(host):
 
 def main():
     args = parse_args()
-    status = get_status(args.host)
-    netinfo = get_netinfo(args.host)
+    deadline.start(args.deadline)
+    with deadline.phase("status"):
+        status = get_status(args.host, response_cache.get_ttl(args, "status"))
+    with deadline.phase("net_info"):
+        netinfo = get_netinfo(args.host, response_cache.get_ttl(args, "net_info"))
     delay = args.delta
 
     npeers = int(netinfo["result"]["n_peers"])
-    latest_block_time = dateutil.parser.parse(
-        datetime.strftime(
-            dateutil.parser.parse(status["result"]["sync_info"]["latest_block_time"]),
-            "%Y-%m-%dT%H:%M:%S",
-        )
+    latest_block_time, delta = rfc3339.parse_age(
+        status["result"]["sync_info"]["latest_block_time"]
     )
     latest_block_height = status["result"]["sync_info"]["latest_block_height"]
     catching_up = status["result"]["sync_info"]["catching_up"]
     votingpower = int(status["result"]["validator_info"]["voting_power"])
-    now = datetime.utcnow().replace(microsecond=0)
-    delta = now - latest_block_time
-    state = f"Voting power: {votingpower}, Latest block: {latest_block_height}, Latest block time: {latest_block_time}, delta: {delta}, Peers connected: {npeers}"
+    state = f"Voting power: {votingpower}, Latest block: {latest_block_height}, Latest block time: {latest_block_time:%Y-%m-%d %H:%M:%S}, delta: {delta}, Peers connected: {npeers}"
     npeersstate = f"Only {npeers} peers connected!, "
 
     if npeers < args.peers:
-        print("CRITICAL - Status: " + npeersstate + state)
+        print(timing.append_perfdata("CRITICAL - Status: " + npeersstate + state))
         sys.exit(2)
-    elif delta.seconds >= delay:
-        print("CRITICAL - Status: Delta is too big!, " + state)
+    elif delta.total_seconds() >= delay:
+        print(timing.append_perfdata("CRITICAL - Status: Delta is too big!, " + state))
         sys.exit(2)
 
     if votingpower > 0:
-        print("OK - Status: Validating " + state)
+        print(timing.append_perfdata("OK - Status: Validating " + state))
         sys.exit(0)
     else:
-        print("CRITICAL - Status: DOWN " + state)
+        print(timing.append_perfdata("CRITICAL - Status: DOWN " + state))
         sys.exit(2)
 
     if catching_up == False:
-        print("OK - Status: " + state)
+        print(timing.append_perfdata("OK - Status: " + state))
         sys.exit(0)
     else:
-        print("CRITICAL - Status: " + state)
+        print(timing.append_perfdata("CRITICAL - Status: " + state))
         sys.exit(2)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
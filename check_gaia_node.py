@@ -1,11 +1,17 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import profiling
 import sys
-import requests
+import transport
+import timing
+import deadline
+import response_cache
 import argparse
-from datetime import datetime
-import dateutil.parser
+import rfc3339
+import multihost
+import heighthist
+import blocktracker
 
 
 def parse_args():
@@ -15,48 +21,74 @@ def parse_args():
         "--host",
         help="Hostname or IP address of the node to check, e.g. 127.0.0.1:8841, domain.com:1234",
     )
+    multihost.add_arguments(parser)
+    heighthist.add_arguments(parser)
+    blocktracker.add_arguments(parser)
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["status"])
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-    if args.host is None:
+    if args.host is None and not multihost.get_hosts(args):
         print("Server is not set, exiting.")
         sys.exit(2)
     return args
 
 
-def get_status(host):
+def fetch_status(host, cache_ttl=0):
+    return transport.get("http://" + host + "/status", timeout=5, cache_ttl=cache_ttl).json()
+
+
+def get_status(host, cache_ttl=0):
     try:
-        status = requests.get("http://" + host + "/status", timeout=5)
+        return fetch_status(host, cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         print("CRITICAL - " + str(ex))
         sys.exit(2)
-    return status.json()
 
 
-def main():
-    args = parse_args()
-    status = get_status(args.host)
-
-    latest_block_time = dateutil.parser.parse(
-        datetime.strftime(
-            dateutil.parser.parse(status["result"]["sync_info"]["latest_block_time"]),
-            "%Y-%m-%dT%H:%M:%S",
-        )
+def evaluate(args, status, host=None):
+    latest_block_time, delta = rfc3339.parse_age(
+        status["result"]["sync_info"]["latest_block_time"]
     )
     latest_block_height = status["result"]["sync_info"]["latest_block_height"]
     catching_up = status["result"]["sync_info"]["catching_up"]
-    now = datetime.utcnow()
-    delta = now - latest_block_time
-    state = f"Is catching up: {catching_up}, Latest block: {latest_block_height}, Latest block time: {latest_block_time}, delta: {delta}"
+    state = f"Is catching up: {catching_up}, Latest block: {latest_block_height}, Latest block time: {latest_block_time:%Y-%m-%d %H:%M:%S}, delta: {delta}"
+    if args.history and host:
+        trend = heighthist.record(
+            f"gaia:{host}", latest_block_height, window=args.history_window
+        )
+        state += ", " + heighthist.describe(trend)
 
-    if delta.seconds >= 30:
-        print("CRITICAL - Status: Delta is too big!, " + state)
-        sys.exit(2)
+    if delta.total_seconds() >= 30:
+        return 2, "CRITICAL - Status: Delta is too big!, " + state
     elif catching_up == False:
-        print("OK - Status: " + state)
-        sys.exit(0)
+        return 0, "OK - Status: " + state
     else:
-        print("CRITICAL - Status: " + state)
-        sys.exit(2)
+        return 2, "CRITICAL - Status: " + state
+
+
+def main():
+    args = parse_args()
+    deadline.start(args.deadline)
+    hosts = multihost.get_hosts(args)
+    if hosts:
+        multihost.run(
+            lambda host: evaluate(
+                args, blocktracker.read_status(args, host) or fetch_status(host, response_cache.get_ttl(args, "status")), host
+            ),
+            hosts,
+            args.concurrency,
+            args.aggregate,
+        )
+
+    with deadline.phase("status"):
+        status = blocktracker.read_status(args, args.host) or get_status(args.host, response_cache.get_ttl(args, "status"))
+    code, message = evaluate(args, status, args.host)
+    print(timing.append_perfdata(message))
+    sys.exit(code)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
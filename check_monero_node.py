@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
 
-import argparse, sys, requests, logging
+import profiling
+import argparse, sys, logging
+import transport
+import timing
+import deadline
+import response_cache
+import upstream_quorum
+import heighthist
 
-assert sys.version_info >= (3, 6), "This script requires Python 3.6 or higher"
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+
+payload = {"jsonrpc": "2.0", "id": "0", "method": "get_block_count"}
+headers = {"Content-Type": "application/json"}
+# https://xmr.ditatompel.com/remote-nodes
+UPSTREAMS = ["http://testnet.xmr-tw.org:28081/json_rpc"]
+UPSTREAM_BUDGET = 3
 
 
 def parse_args():
@@ -21,39 +35,56 @@ def parse_args():
         default=5,
         help="Delta between upstream block and current block, default value is 5 sec",
     )
+    parser.add_argument(
+        "--upstream-ttl",
+        type=int,
+        default=5,
+        help="Seconds to share the upstream block height between checks, 0 disables the cache, default value is 5 sec",
+    )
+    upstream_quorum.add_arguments(parser, UPSTREAMS, UPSTREAM_BUDGET)
+    deadline.add_arguments(parser)
+    response_cache.add_arguments(parser, ["json_rpc"])
+    heighthist.add_arguments(parser)
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
     return args
 
 
-payload = {"jsonrpc": "2.0", "id": "0", "method": "get_block_count"}
-headers = {"Content-Type": "application/json"}
+def fetch_status(host, cache_ttl=0):
+    url = f"http://{host}/json_rpc"
+    return transport.get(url, json=payload, headers=headers, timeout=3, cache_ttl=cache_ttl).json()
 
 
-def get_status(host):
-    url = f"http://{host}/json_rpc"
+def get_status(host, cache_ttl=0):
     try:
-        status = requests.get(url, json=payload, headers=headers, timeout=3)
-
+        return fetch_status(host, cache_ttl)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         logging.info(f"CRITICAL - {ex}")
         sys.exit(2)
 
-    return status.json()
 
+def fetch_upstream_block(upstream, timeout):
+    # Upstreams are json_rpc URLs, a bare host:port gets the usual path
+    if "://" not in upstream:
+        upstream = f"http://{upstream}/json_rpc"
+    upstream_status = transport.get(upstream, json=payload, headers=headers, timeout=timeout).json()
+    logging.debug(upstream_status)
+    return int(upstream_status["result"]["count"])
 
-def get_upstream_status():
-    # https://xmr.ditatompel.com/remote-nodes
-    url = "http://testnet.xmr-tw.org:28081/json_rpc"
+
+def get_upstream_block(args):
     try:
-        upstream_status = requests.get(url, json=payload, headers=headers, timeout=3)
+        return upstream_quorum.get_args_height(args, fetch_upstream_block)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         logging.info(f"CRITICAL - {ex}")
         sys.exit(2)
 
-    return upstream_status.json()
-
 
 def main():
     args = parse_args()
@@ -69,29 +100,36 @@ def main():
             level=logging.INFO,
         )
 
+    deadline.start(args.deadline)
     host = args.host
     delta = args.delta
-    upstream_status = get_upstream_status()
-    logging.debug(upstream_status)
-    upstream_block = int(upstream_status["result"]["count"])
-    logging.debug(f"upstream_block:{upstream_block}")
-    status = get_status(host)
+    upstream_block, cache_info, quorum_info = get_upstream_block(args)
+    logging.debug(f"upstream_block:{upstream_block}, cache:{cache_info}, quorum:{quorum_info}")
+    with deadline.phase("status"):
+        status = get_status(host, response_cache.get_ttl(args, "json_rpc"))
     logging.debug(f"status:{status}")
-    block = int(upstream_status["result"]["count"])
+    block = int(status["result"]["count"])
     logging.debug(f"block:{block}")
+    transport.log_stats()
     delay = upstream_block - block
-    state = f"Current block: {block}, Upstream block: {upstream_block}"
+    state = f"Current block: {block}, Upstream block: {upstream_block} ({upstream_quorum.describe(cache_info, quorum_info)})"
+    if args.history:
+        trend = heighthist.record(
+            f"monero:{host}", block, upstream_block, args.history_window, delta
+        )
+        logging.debug(f"trend:{trend}")
+        state += f", {heighthist.describe(trend)}"
 
     if delay >= delta:
-        logging.info(f"CRITICAL - delta is {delay} blocks. {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - delta is {delay} blocks. {state}"))
         sys.exit(2)
     elif delay < delta:
-        logging.info(f"OK - {state}, Delta: {delay}")
+        logging.info(timing.append_perfdata(f"OK - {state}, Delta: {delay}"))
         sys.exit(0)
     else:
-        logging.info(f"CRITICAL - {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - {state}"))
         sys.exit(2)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
-import argparse, sys, os
+import profiling
+import argparse, sys, os, re, fnmatch, queue, threading, time
 
-assert sys.version_info >= (3, 6), "This script requires Python 3.6 or higher"
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+MOUNTINFO = "/proc/self/mountinfo"
 
 
 def parse_args():
@@ -12,32 +15,256 @@ def parse_args():
         "--mountpoint",
         type=str,
         action="append",
-        required=True,
+        default=[],
         help="Specify a mountpoint to check. This option can be specified multiple times to check multiple mountpoints, e.g. -m /home --mountpoint /mnt -m /",
     )
+    parser.add_argument(
+        "-g",
+        "--glob",
+        action="append",
+        default=[],
+        help="Check every mountpoint matching this shell pattern, at least one has to be mounted, e.g. -g '/srv/nfs/*'",
+    )
+    parser.add_argument(
+        "-r",
+        "--regex",
+        action="append",
+        default=[],
+        help="Check every mountpoint fully matching this regular expression, at least one has to be mounted, e.g. -r '/data/disk[0-9]+'",
+    )
+    parser.add_argument(
+        "--fstype",
+        action="append",
+        default=[],
+        help="Expected filesystem type of the checked mountpoints, can be specified multiple times to allow several, e.g. --fstype nfs4",
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        help="Mount option every checked mountpoint must have, can be specified multiple times, e.g. --option rw --option noexec",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="Call statvfs on every checked mountpoint to find hung mounts, e.g. of a dead NFS or CIFS server",
+    )
+    parser.add_argument(
+        "--probe-warn",
+        type=float,
+        default=1,
+        help="Seconds after which a probe makes the mountpoint slow (WARNING), default value is 1",
+    )
+    parser.add_argument(
+        "--probe-crit",
+        type=float,
+        default=5,
+        help="Seconds after which a probe is given up and the mountpoint is hung (CRITICAL), default value is 5",
+    )
+    parser.add_argument(
+        "--probe-workers",
+        type=int,
+        default=8,
+        help="Maximal amount of probes running at the same time, not counting hung ones, default value is 8",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10,
+        help="Seconds after which mountpoints still waiting for a probe are reported unprobed, default value is 10",
+    )
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    if not (args.mountpoint or args.glob or args.regex):
+        parser.error("at least one of --mountpoint, --glob or --regex is required")
 
     return args
 
 
+def unescape(field):
+    # Spaces, tabs, newlines and backslashes in paths are octal escapes
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
+
+
+def read_mountinfo(path=MOUNTINFO):
+    # {mountpoint: {"fstype", "source", "options"}} from a single read. When
+    # several mounts share a mountpoint the last one is the visible one.
+    mounts = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            separator = fields.index("-", 6)
+            fstype, source, super_options = fields[separator + 1 : separator + 4]
+            options = set(fields[5].split(",")) | set(super_options.split(","))
+            # Read-only at either the mount or the superblock level wins
+            if "ro" in options:
+                options.discard("rw")
+            mounts[unescape(fields[4])] = {"fstype": fstype, "source": unescape(source), "options": options}
+    return mounts
+
+
+def select_mounts(args, mounts):
+    # Returns the mountpoints to check and the missing ones
+    selected, missing = [], []
+    for mountpoint in args.mountpoint:
+        mountpoint = os.path.normpath(mountpoint)
+        if mountpoint in mounts:
+            selected.append(mountpoint)
+        else:
+            missing.append(mountpoint)
+    for pattern in args.glob:
+        matches = [mountpoint for mountpoint in mounts if fnmatch.fnmatchcase(mountpoint, pattern)]
+        selected.extend(matches)
+        if not matches:
+            missing.append(pattern)
+    for pattern in args.regex:
+        regex = re.compile(pattern)
+        matches = [mountpoint for mountpoint in mounts if regex.fullmatch(mountpoint)]
+        selected.extend(matches)
+        if not matches:
+            missing.append(pattern)
+    return list(dict.fromkeys(selected)), missing
+
+
+def check_mount(args, mount):
+    problems = []
+    if args.fstype and mount["fstype"] not in args.fstype:
+        problems.append(f"is {mount['fstype']}, expected {' or '.join(args.fstype)}")
+    absent = [option for option in args.option if option not in mount["options"]]
+    if absent:
+        problems.append(f"lacks {','.join(absent)}")
+    return problems
+
+
+def probe_mounts(mountpoints, workers, probe_timeout, timeout):
+    # statvfs in daemon threads, each probe with its own deadline. A probe
+    # that is stuck in the kernel can't be cancelled, so its worker is
+    # written off and replaced instead of holding up the remaining mounts.
+    # Returns {mountpoint: (seconds, error)} of the probes that finished, the
+    # set of hung mountpoints, whose probe ran for probe_timeout at least, and
+    # the set of mountpoints whose probe started at all. A probe started too
+    # late to become hung before timeout is in neither of the first two.
+    pending = queue.Queue()
+    for mountpoint in mountpoints:
+        pending.put(mountpoint)
+    started, finished = {}, {}
+    condition = threading.Condition()
+
+    def worker():
+        while True:
+            try:
+                mountpoint = pending.get_nowait()
+            except queue.Empty:
+                return
+            with condition:
+                started[mountpoint] = time.monotonic()
+                # The main thread has to learn the new probe's deadline
+                condition.notify()
+            error = None
+            try:
+                os.statvfs(mountpoint)
+            except OSError as ex:
+                error = ex
+            with condition:
+                finished[mountpoint] = (time.monotonic() - started[mountpoint], error)
+                condition.notify()
+
+    def spawn():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(min(workers, len(mountpoints))):
+        spawn()
+    deadline = time.monotonic() + timeout
+    hung = set()
+    with condition:
+        while len(finished) < len(mountpoints):
+            now = time.monotonic()
+            running = [m for m in started if m not in finished and m not in hung]
+            for mountpoint in running:
+                if now - started[mountpoint] >= probe_timeout:
+                    hung.add(mountpoint)
+                    if not pending.empty():
+                        spawn()
+            running = [m for m in running if m not in hung]
+            # A worker may have taken a mountpoint off the queue without having
+            # started its probe yet, so wait for every one to be done or hung
+            if all(m in finished or m in hung for m in mountpoints) or now >= deadline:
+                break
+            condition.wait(min([started[m] + probe_timeout for m in running] + [deadline]) - now)
+        return dict(finished), set(hung), set(started)
+
+
 def main():
     args = parse_args()
-    mountpoint = args.mountpoint
+    try:
+        mounts = read_mountinfo()
+    except OSError as ex:
+        print(f"UNKNOWN - Can't read {MOUNTINFO}: {ex}")
+        sys.exit(3)
+    selected, missing = select_mounts(args, mounts)
     status_ok = ""
     status_critical = ""
+    status_hung = ""
+    status_unprobed = ""
+    status_slow = ""
+    perfdata = ""
 
-    for element in mountpoint:
-        if os.path.ismount(element):
-            status_ok += f"{element} is mounted "
-        else:
-            status_critical += f"{element} is not mounted "
-    if len(status_critical) == 0:
-        print(f"OK - {status_ok}")
-        sys.exit(0)
-    else:
-        print(f"CRITICAL - {status_critical} {status_ok}")
+    if args.probe:
+        probes, hung, probed = probe_mounts(selected, args.probe_workers, args.probe_crit, args.timeout)
+    for element in missing:
+        status_critical += f"{element} is not mounted "
+    for element in selected:
+        problems = check_mount(args, mounts[element])
+        if problems:
+            status_critical += f"{element} {' and '.join(problems)} "
+            continue
+        if args.probe:
+            label = "'" + element.replace("'", "''") + "'"
+            if element not in probed:
+                status_unprobed += f"{element} is unprobed "
+                perfdata += f"{label}=U;{args.probe_warn:g};{args.probe_crit:g} "
+                continue
+            if element in hung:
+                status_hung += f"{element} is hung "
+                perfdata += f"{label}=U;{args.probe_warn:g};{args.probe_crit:g} "
+                continue
+            if element not in probes:
+                status_unprobed += f"{element} probe timed out "
+                perfdata += f"{label}=U;{args.probe_warn:g};{args.probe_crit:g} "
+                continue
+            elapsed, error = probes[element]
+            perfdata += f"{label}={elapsed:.6f}s;{args.probe_warn:g};{args.probe_crit:g} "
+            if error is not None:
+                status_hung += f"{element} probe failed: {error.strerror} "
+                continue
+            if elapsed >= args.probe_crit:
+                status_hung += f"{element} answered in {elapsed:.1f}s "
+                continue
+            if elapsed >= args.probe_warn:
+                status_slow += f"{element} answered in {elapsed:.1f}s "
+                continue
+        status_ok += f"{element} is mounted "
+    if perfdata:
+        perfdata = " | " + perfdata.strip()
+    # Unmounted or unexpected mounts keep their historical exit code 1
+    # Unprobed mounts ran out of --timeout behind other probes or before their
+    # probe reached --probe-crit, their state is unknown rather than hung
+    if status_hung:
+        print(f"CRITICAL - {status_hung}{status_critical}{status_unprobed}{status_slow} {status_ok}{perfdata}")
+        sys.exit(2)
+    elif status_critical:
+        print(f"CRITICAL - {status_critical}{status_unprobed}{status_slow} {status_ok}{perfdata}")
+        sys.exit(1)
+    elif status_unprobed:
+        print(f"UNKNOWN - {status_unprobed}{status_slow} {status_ok}{perfdata}")
+        sys.exit(3)
+    elif status_slow:
+        print(f"WARNING - {status_slow} {status_ok}{perfdata}")
         sys.exit(1)
+    else:
+        print(f"OK - {status_ok}{perfdata}")
+        sys.exit(0)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
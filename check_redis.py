@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 
-import argparse, redis, logging, sys
+import profiling
+import argparse, redis, logging, sys, time
+import deadline
+import statefile
 
 
-assert sys.version_info >= (3, 6), "This script requires Python 3.6 or higher"
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Check redis script")
-    parser.add_argument("--warn", "-w", type=float, required=True, help="Warning level")
-    parser.add_argument(
-        "--crit", "-c", type=float, required=True, help="Critical level"
-    )
+    parser.add_argument("--warn", "-w", type=float, help="Warning level")
+    parser.add_argument("--crit", "-c", type=float, help="Critical level")
     parser.add_argument(
         "-H",
         "--host",
@@ -22,13 +23,172 @@ def parse_args():
     parser.add_argument(
         "--timeout", "-t", type=int, default=5, help="Connection timeout in seconds"
     )
-    parser.add_argument("--metric", "-m", required=True, help="Metric to check")
+    parser.add_argument("--metric", "-m", help="Metric to check")
+    parser.add_argument(
+        "--check",
+        "-M",
+        action="append",
+        default=[],
+        help="Metric to check with its levels as METRIC,WARN,CRIT, can be specified multiple times, e.g. -M connected_clients,500,900 -M used_memory,1e9,2e9. "
+        "Any counter can be checked as a rate with a _per_sec suffix, e.g. evicted_keys_per_sec, and keyspace_hit_ratio is the hit percentage since the previous run. "
+        "If WARN is greater than CRIT, lower values are worse, e.g. -M keyspace_hit_ratio,90,80",
+    )
+    deadline.add_arguments(parser)
     parser.add_argument("--debug", "-d", action="store_true", help="Enable debug mode")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
+    args.checks = []
+    if args.metric:
+        if args.warn is None or args.crit is None:
+            parser.error("--metric requires --warn and --crit")
+        args.checks.append((args.metric, args.warn, args.crit))
+    for check in args.check:
+        try:
+            metric, warn, crit = check.split(",")
+            args.checks.append((metric, float(warn), float(crit)))
+        except ValueError:
+            parser.error(f"Invalid --check {check}, expected METRIC,WARN,CRIT")
+    if not args.checks:
+        parser.error("Either --metric or --check is required")
+
     return args
 
 
+# INFO section of each metric, so that only the needed sections are fetched
+SECTIONS = {
+    "server": ("redis_", "uptime_", "process_id", "lru_clock", "hz", "configured_hz", "io_threads_active"),
+    "clients": ("connected_clients", "blocked_clients", "maxclients", "client_recent_", "tracking_clients", "clients_in_timeout_table", "cluster_connections", "pubsub_clients", "watching_clients", "total_blocking_keys", "total_watched_keys"),
+    "memory": ("used_memory", "mem_", "maxmemory", "allocator_", "rss_", "total_system_memory", "lazyfree_pending_objects", "active_defrag_running"),
+    "persistence": ("loading", "async_loading", "rdb_", "aof_", "module_fork_", "current_cow_", "current_fork_perc", "current_save_keys_"),
+    "stats": ("total_", "instantaneous_", "rejected_connections", "sync_", "expired_", "evicted_", "keyspace_", "pubsub_channels", "pubsub_patterns", "latest_fork_usec", "migrate_cached_sockets", "slave_expires_tracked_keys", "active_defrag_", "tracking_total_", "unexpected_error_replies", "dump_payload_sanitizations", "io_threaded_", "client_query_buffer_limit_disconnections", "client_output_buffer_limit_disconnections", "acl_access_denied_"),
+    "replication": ("role", "connected_slaves", "master_", "slave_", "second_repl_offset", "repl_backlog_"),
+    "cpu": ("used_cpu_",),
+    "cluster": ("cluster_enabled",),
+    "keyspace": ("db",),
+}
+
+
+RATE_SUFFIX = "_per_sec"
+HIT_RATIO = "keyspace_hit_ratio"
+
+
+def get_counters(metric):
+    # INFO counters a derived metric is computed from, None for plain metrics
+    if metric == HIT_RATIO:
+        return ["keyspace_hits", "keyspace_misses"]
+    elif metric.endswith(RATE_SUFFIX):
+        return [metric[: -len(RATE_SUFFIX)]]
+    return None
+
+
+def get_section(metric):
+    for section, prefixes in SECTIONS.items():
+        if metric.startswith(prefixes):
+            return section
+    return None
+
+
+def get_client(args):
+    host = args.host.split(":")
+    if len(host) == 2:
+        host, port = host
+    else:
+        host = host[0]
+        port = 6379
+    logging.debug(f"host={host},port={port}")
+
+    timeout = deadline.timeout(args.timeout)
+    options = {"socket_timeout": timeout}
+    if deadline.remaining() is not None:
+        # Retries would start over with the full timeout. Only --deadline
+        # needs redis-py 4.1, older versions work without it.
+        try:
+            from redis.backoff import NoBackoff
+            from redis.retry import Retry
+        except ImportError:
+            print(f"UNKNOWN - --deadline requires redis-py 4.1 or higher, this is {redis.__version__}")
+            sys.exit(3)
+        options.update(socket_connect_timeout=timeout, retry=Retry(NoBackoff(), 0))
+    if args.password:
+        client = redis.Redis(host=host, port=port, password=args.password, **options)
+    else:
+        client = redis.Redis(host=host, port=port, **options)
+    return client
+
+
+def get_stats(client, metrics):
+    # One INFO round trip: the needed sections if they are all known,
+    # otherwise the default set. Redis < 7 takes a single section only.
+    sections = {get_section(metric) for metric in metrics}
+    logging.debug(f"sections={sections}")
+    if None in sections:
+        return client.info()
+    sections = sorted(sections)
+    if len(sections) == 1:
+        return client.info(sections[0])
+    try:
+        return client.info(*sections)
+    except TypeError:
+        # Older redis-py versions take a single section only
+        logging.debug("redis-py takes a single INFO section, fetching them one by one")
+        stats = {}
+        for section in sections:
+            stats.update(client.info(section))
+        return stats
+    except redis.ResponseError:
+        logging.debug("multiple INFO sections are not supported, fetching all")
+        return client.info()
+
+
+def get_derived(stats, metrics, instance):
+    # Rates from the previous sample of each counter, kept per instance in a
+    # small state file. Returns {metric: value}, value is None until there is
+    # a usable previous sample (first run or counter reset by a restart).
+    # Metrics whose counters INFO lacks are left out, they are not available
+    # rather than waiting for a sample that never comes.
+    counters = set()
+    for metric in metrics:
+        counters.update(get_counters(metric) or [])
+    if not counters:
+        return {}
+
+    now = time.time()
+    path = statefile.state_path("redis", instance)
+    with statefile.locked(path):
+        state = statefile.read_json(path) or {}
+        previous = {counter: state.get(counter) for counter in counters}
+        for counter in counters:
+            if isinstance(stats.get(counter), (int, float)):
+                state[counter] = [now, stats[counter]]
+        statefile.write_json(path, state)
+    logging.debug(f"previous={previous}")
+
+    def rate(counter):
+        if previous[counter] is None or counter not in stats:
+            return None
+        then, value = previous[counter]
+        if stats[counter] < value or now <= then:
+            return None
+        return (stats[counter] - value) / (now - then)
+
+    derived = {}
+    for metric in metrics:
+        counters = get_counters(metric)
+        if counters is None or not all(isinstance(stats.get(counter), (int, float)) for counter in counters):
+            continue
+        if metric == HIT_RATIO:
+            hits, misses = rate("keyspace_hits"), rate("keyspace_misses")
+            if hits is None or misses is None or hits + misses == 0:
+                derived[metric] = None
+            else:
+                derived[metric] = round(100 * hits / (hits + misses), 2)
+        elif metric.endswith(RATE_SUFFIX):
+            value = rate(metric[: -len(RATE_SUFFIX)])
+            derived[metric] = None if value is None else round(value, 2)
+    return derived
+
+
 def check_metric(stats, metric):
     if metric in stats:
         logging.debug(f"metric={metric}")
@@ -37,38 +197,74 @@ def check_metric(stats, metric):
         return value
     else:
         logging.info(f"Available metrics are {str(list(stats.keys()))}")
-        sys.exit(1)
+        return None
 
 
-def check_threshold(value, args):
-    state = f"{args.metric} is {value}"
+def check_threshold(metric, value, warn, crit):
+    state = f"{metric} is {value}"
     logging.debug(f"state={state}")
     if not isinstance(value, float):
         try:
             value = float(value)
         except Exception as ex:
             logging.debug(f"can't convert {value} to float")
-            return ("CRITICAL", f"Error: can't convert {value} to float")
-    if value >= args.warn and value < args.crit:
+            return ("CRITICAL", f"Error: can't convert {metric} value {value} to float")
+    if warn > crit:
+        # Lower is worse
+        if value <= crit:
+            return ("CRITICAL", f"{state}")
+        elif value <= warn:
+            return ("WARNING", f"{state}")
+        return ("OK", f"{state}")
+    if value >= warn and value < crit:
         logging.debug(f"WARNING - {state}")
         return ("WARNING", f"{state}")
-    elif value >= args.crit:
+    elif value >= crit:
         logging.debug(f"CRITICAL - {state}")
         return ("CRITICAL", f"{state}")
-    elif value < args.warn:
+    elif value < warn:
         logging.debug(f"OK - {state}")
         return ("OK", f"{state}")
-    elif value < args.crit:
-        logging.debug(f"Value {value} is less than critical threshold {args.crit}")
+    elif value < crit:
+        logging.debug(f"Value {value} is less than critical threshold {crit}")
         return (
             "CRITICAL",
-            f"Value {value} is less than critical threshold {args.crit}",
+            f"Value {value} is less than critical threshold {crit}",
         )
     else:
         logging.debug(f"UNKNOWN - {state}")
         return ("CRITICAL", f"{state}")
 
 
+EXIT_CODES = {"OK": 0, "WARNING": 1, "CRITICAL": 2}
+
+
+def evaluate(stats, checks):
+    # Returns (worst status, message, perfdata) for all METRIC,WARN,CRIT checks
+    results = []
+    perfdata = []
+    for metric, warn, crit in checks:
+        if metric in stats and stats[metric] is None:
+            results.append(("OK", f"{metric} has no previous sample yet"))
+            continue
+        value = check_metric(stats, metric)
+        if value is None:
+            results.append(("WARNING", f"{metric} is not available"))
+            continue
+        results.append(check_threshold(metric, value, warn, crit))
+        if isinstance(value, (int, float)):
+            perfdata.append(f"{metric}={value};{warn:g};{crit:g}")
+    status = max((status for status, _ in results), key=EXIT_CODES.get)
+    if len(results) == 1:
+        message = results[0][1]
+    else:
+        message = ", ".join(
+            message if status == "OK" else f"{status} {message}"
+            for status, message in results
+        )
+    return status, message, " ".join(perfdata)
+
+
 def main():
     args = parse_args()
 
@@ -85,35 +281,27 @@ def main():
             level=logging.INFO,
         )
 
-    host = args.host.split(":")
-    if len(host) == 2:
-        host, port = host
-    else:
-        host = host[0]
-        port = 6379
-    logging.debug(f"host={host},port={port}")
-
-    if args.password:
-        client = redis.Redis(host=host, port=port, password=args.password)
-    else:
-        client = redis.Redis(host=host, port=port)
-
-    stats = client.info()
+    deadline.start(args.deadline)
+    client = get_client(args)
+    metrics = [metric for metric, _, _ in args.checks]
+    counters = []
+    for metric in metrics:
+        counters.extend(get_counters(metric) or [metric])
+    try:
+        with deadline.phase("info"):
+            stats = get_stats(client, counters)
+    except redis.RedisError:
+        if deadline.expired():
+            deadline.fail(deadline.exceeded())
+        raise
     logging.debug(f"stats={stats}")
-    value = check_metric(stats, args.metric)
-    logging.debug(f"value={value}")
-    check_threshold(value, args)
-    status, message = check_threshold(value, args)
+    stats.update(get_derived(stats, metrics, args.host))
+    status, message, perfdata = evaluate(stats, args.checks)
+    if perfdata:
+        message = f"{message} | {perfdata}"
     logging.info(f"{status}: {message}")
-    if status == "OK":
-        sys.exit(0)
-    elif status == "WARNING":
-        sys.exit(1)
-    elif status == "CRITICAL":
-        sys.exit(2)
-    else:
-        sys.exit(2)
+    sys.exit(EXIT_CODES.get(status, 2))
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+# Finds big keys and key prefixes by walking the keyspace with SCAN. Every run
+# continues from the cursor saved by the previous one and stops at a time and
+# key budget, so a full pass over a big instance is spread over many runs and
+# never blocks the server.
+
+import profiling
+import argparse, redis, logging, sys, time
+import deadline
+import statefile
+from check_redis import get_client, EXIT_CODES
+
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+UNITS = {"": 1, "B": 1, "K": 1 << 10, "KB": 1 << 10, "M": 1 << 20, "MB": 1 << 20, "G": 1 << 30, "GB": 1 << 30}
+MAX_PREFIXES = 1000
+MAX_KEYS = 20
+
+
+def parse_size(value):
+    number = value.rstrip("BKMGbkmg")
+    unit = value[len(number) :].upper()
+    if unit not in UNITS:
+        raise argparse.ArgumentTypeError(f"Invalid size {value}, e.g. 512K, 100MB, 2G")
+    return int(float(number) * UNITS[unit])
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        if size >= UNITS[unit]:
+            return f"{size / UNITS[unit]:.1f}{unit}"
+    return f"{size}B"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check redis for big keys and key prefixes")
+    parser.add_argument(
+        "-H",
+        "--host",
+        help="hostname and port of the Redis server, e.g. 127.0.1:6379, domain.com:6379",
+        default="127.0.1:6379",
+    )
+    parser.add_argument("--password", "-P", help="Password")
+    parser.add_argument(
+        "--timeout", "-t", type=int, default=5, help="Connection timeout in seconds"
+    )
+    parser.add_argument("--warn", "-w", type=parse_size, required=True, help="Warning size of a single key, e.g. 50MB")
+    parser.add_argument("--crit", "-c", type=parse_size, required=True, help="Critical size of a single key, e.g. 200MB")
+    parser.add_argument("--prefix-warn", type=parse_size, help="Warning size of all keys sharing a prefix, e.g. 1G")
+    parser.add_argument("--prefix-crit", type=parse_size, help="Critical size of all keys sharing a prefix, e.g. 4G")
+    parser.add_argument(
+        "--separator",
+        default=":",
+        help="Separator of key prefix parts, default value is :",
+    )
+    parser.add_argument(
+        "--prefix-depth",
+        type=int,
+        default=1,
+        help="Amount of leading key parts that make a prefix, default value is 1",
+    )
+    parser.add_argument("--match", help="Only scan keys matching this SCAN pattern, e.g. session:*")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=100,
+        help="SCAN COUNT and amount of MEMORY USAGE calls per pipeline, default value is 100",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=5,
+        help="MEMORY USAGE SAMPLES for nested values, 0 means all, default value is 5",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=5,
+        help="Stop scanning after this many seconds, default value is 5",
+    )
+    parser.add_argument(
+        "--key-budget",
+        type=int,
+        default=10000,
+        help="Stop scanning after this many keys, default value is 10000",
+    )
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0,
+        help="Milliseconds to sleep between batches to spread the load, default value is 0",
+    )
+    deadline.add_arguments(parser)
+    parser.add_argument("--debug", "-d", action="store_true", help="Enable debug mode")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    return args
+
+
+def new_cycle():
+    return {"started": time.time(), "keys": 0, "prefixes": {}, "big": {}}
+
+
+def get_prefix(key, args):
+    parts = key.split(args.separator)
+    if len(parts) <= 1:
+        return None
+    return args.separator.join(parts[: min(args.prefix_depth, len(parts) - 1)])
+
+
+def scan(client, state, args):
+    # Advances state["cursor"] and accumulates into state["cycle"] until the
+    # budget is spent. Returns the amount of keys scanned in this run.
+    budget = args.time_budget
+    if deadline.remaining() is not None:
+        # Leave time for saving the state and DBSIZE after the last batch
+        budget = min(budget, deadline.remaining() / 2)
+    stop = time.monotonic() + budget
+    scanned = 0
+    cycle = state["cycle"]
+    while scanned < args.key_budget and time.monotonic() < stop:
+        cursor, keys = client.scan(state["cursor"], match=args.match, count=args.batch)
+        if keys:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                if args.samples:
+                    pipe.memory_usage(key, samples=args.samples)
+                else:
+                    pipe.execute_command("MEMORY USAGE", key, "SAMPLES", 0)
+                pipe.type(key)
+            replies = pipe.execute(raise_on_error=False)
+            for i, key in enumerate(keys):
+                size, kind = replies[2 * i], replies[2 * i + 1]
+                if not isinstance(size, int):
+                    # Expired or deleted since SCAN returned it
+                    continue
+                name = key.decode(errors="backslashreplace")
+                kind = kind.decode() if isinstance(kind, bytes) else str(kind)
+                prefix = get_prefix(name, args)
+                if prefix is not None:
+                    cycle["prefixes"][prefix] = cycle["prefixes"].get(prefix, 0) + size
+                if size >= args.warn:
+                    cycle["big"][name] = [size, kind]
+            scanned += len(keys)
+            cycle["keys"] += len(keys)
+        state["cursor"] = int(cursor)
+        if state["cursor"] == 0:
+            # Full pass over the keyspace done, the next run starts the next
+            # one. Going on here would rescan a small keyspace over and over.
+            cycle["finished"] = time.time()
+            state["last"] = trim(cycle)
+            state["cycle"] = new_cycle()
+            return scanned
+        if args.pause:
+            time.sleep(args.pause / 1000)
+    trim(cycle, prefixes=False)
+    return scanned
+
+
+def trim(cycle, prefixes=True):
+    # Every key is seen once per pass, so the biggest ones can be cut down
+    # after each run. Prefix totals keep growing until the end of the pass,
+    # cutting them down before would drop prefixes whose keys come later.
+    if prefixes:
+        cycle["prefixes"] = dict(sorted(cycle["prefixes"].items(), key=lambda item: -item[1])[:MAX_PREFIXES])
+    cycle["big"] = dict(sorted(cycle["big"].items(), key=lambda item: -item[1][0])[:MAX_KEYS])
+    return cycle
+
+
+def evaluate(state, args):
+    # Keys from the running and the last complete pass; prefix totals of the
+    # running pass only grow, so they count as soon as they cross a level.
+    big = dict(state.get("last", {}).get("big", {}))
+    big.update(state["cycle"]["big"])
+    prefixes = dict(state.get("last", {}).get("prefixes", {}))
+    for prefix, size in state["cycle"]["prefixes"].items():
+        prefixes[prefix] = max(size, prefixes.get(prefix, 0))
+
+    status = "OK"
+    problems = []
+    for name, (size, kind) in sorted(big.items(), key=lambda item: -item[1][0]):
+        if size >= args.crit:
+            status = "CRITICAL"
+        elif status == "OK":
+            status = "WARNING"
+        problems.append(f"key {name} ({kind}) is {format_size(size)}")
+    if args.prefix_warn is not None or args.prefix_crit is not None:
+        prefix_warn = args.prefix_warn if args.prefix_warn is not None else args.prefix_crit
+        prefix_crit = args.prefix_crit if args.prefix_crit is not None else float("inf")
+        for prefix, size in sorted(prefixes.items(), key=lambda item: -item[1]):
+            if size < prefix_warn:
+                break
+            if size >= prefix_crit:
+                status = "CRITICAL"
+            elif status == "OK":
+                status = "WARNING"
+            problems.append(f"prefix {prefix}{args.separator}* is {format_size(size)}")
+    biggest = max((size for size, _ in big.values()), default=0)
+    return status, problems, biggest
+
+
+def main():
+    args = parse_args()
+
+    if args.debug:
+        logging.basicConfig(
+            format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+            stream=sys.stdout,
+            level=logging.DEBUG,
+        )
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            stream=sys.stdout,
+            level=logging.INFO,
+        )
+
+    deadline.start(args.deadline)
+    client = get_client(args)
+    path = statefile.state_path("redis-bigkeys", f"{args.host}/{args.match}")
+    started = time.monotonic()
+    try:
+        with statefile.locked(path):
+            state = statefile.read_json(path) or {"cursor": 0, "cycle": new_cycle()}
+            logging.debug(f"cursor={state['cursor']}")
+            with deadline.phase("scan"):
+                scanned = scan(client, state, args)
+            statefile.write_json(path, state)
+            with deadline.phase("dbsize"):
+                dbsize = client.dbsize()
+    except redis.RedisError as ex:
+        if deadline.expired():
+            deadline.fail(deadline.exceeded())
+        logging.info(f"CRITICAL: {ex}")
+        sys.exit(2)
+    elapsed = time.monotonic() - started
+    logging.debug(f"scanned={scanned}, cursor={state['cursor']}, elapsed={elapsed:.3f}")
+
+    status, problems, biggest = evaluate(state, args)
+    progress = f"scanned {scanned} keys in {elapsed:.1f}s, "
+    if "last" not in state:
+        progress += f"pass at {state['cycle']['keys']} of ~{dbsize} keys, first pass not complete yet"
+    elif state["cursor"] == 0:
+        # This run finished a pass, the next one starts with the next run
+        progress += f"last complete pass covered {state['last']['keys']} of ~{dbsize} keys"
+    else:
+        progress += f"pass at {state['cycle']['keys']} of ~{dbsize} keys"
+    message = ", ".join(problems) if problems else f"no keys over {format_size(args.warn)}"
+    perfdata = (
+        f"scanned_keys={scanned} scan_time={elapsed:.3f}s "
+        f"biggest_key={biggest}B;{args.warn};{args.crit}"
+    )
+    logging.info(f"{status}: {message}, {progress} | {perfdata}")
+    sys.exit(EXIT_CODES[status])
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# Checks many systemd units, given by name or glob, with a single
+# `systemctl show` call. Automatic restarts are tracked between runs, so a
+# unit in a restart loop is caught even when it looks active at check time.
+
+import profiling
+import argparse, sys, time, fnmatch, subprocess
+import statefile
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+PROPERTIES = (
+    "Id",
+    "LoadState",
+    "ActiveState",
+    "SubState",
+    "MainPID",
+    "NRestarts",
+    "ActiveEnterTimestamp",
+    "ActiveEnterTimestampMonotonic",
+)
+STATES = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check systemd units with one systemctl call")
+    parser.add_argument(
+        "units",
+        nargs="+",
+        help="Units or globs of loaded units to check, e.g. nginx.service 'docker*' 'node-*.service'",
+    )
+    parser.add_argument(
+        "--restart-window",
+        type=int,
+        default=900,
+        help="Seconds over which automatic restarts are counted, default value is 900",
+    )
+    parser.add_argument(
+        "--restart-warn",
+        type=int,
+        default=1,
+        help="Restarts within the window for WARNING, default value is 1",
+    )
+    parser.add_argument(
+        "--restart-crit",
+        type=int,
+        default=3,
+        help="Restarts within the window for CRITICAL, default value is 3",
+    )
+    parser.add_argument(
+        "--min-uptime",
+        type=int,
+        default=0,
+        help="Seconds a unit has to be active to be OK, 0 disables, default value is 0",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=int,
+        default=10,
+        help="Timeout of the systemctl call in seconds, default value is 10",
+    )
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    return args
+
+
+def show_units(units, timeout):
+    # Properties of every matching unit, blocks of key=value lines separated
+    # by empty lines
+    output = subprocess.run(
+        ["systemctl", "show", "--no-pager", "-p", ",".join(PROPERTIES), "--"] + list(units),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=timeout,
+        check=True,
+    ).stdout
+    result = {}
+    for block in output.split("\n\n"):
+        unit = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        if unit.get("Id"):
+            result[unit["Id"]] = unit
+    return result
+
+
+def get_restarts(patterns, units, window):
+    # Automatic restarts per unit within the window from the NRestarts
+    # samples of previous runs. NRestarts drops back to 0 when the unit is
+    # restarted by hand, only growth counts. Every service check keeps its
+    # own samples, keyed by its units and window, so checks with different
+    # windows don't prune each other's.
+    key = f"restarts {window:g}s " + " ".join(sorted(patterns))
+    path = statefile.state_path("systemd", key)
+    now = time.time()
+    restarts = {}
+    with statefile.locked(path):
+        state = statefile.read_json(path) or {}
+        for name, unit in units.items():
+            if not unit.get("NRestarts", "").isdigit():
+                continue
+            samples = [sample for sample in state.get(name, []) if now - sample[0] <= window]
+            samples.append([now, int(unit["NRestarts"])])
+            restarts[name] = sum(max(0, b[1] - a[1]) for a, b in zip(samples, samples[1:]))
+            state[name] = samples
+        # Units not seen for a whole window are forgotten
+        state = {name: samples for name, samples in state.items() if now - samples[-1][0] <= window}
+        statefile.write_json(path, state)
+    return restarts
+
+
+def get_uptime(unit):
+    # ActiveEnterTimestampMonotonic is CLOCK_MONOTONIC in microseconds
+    entered = int(unit.get("ActiveEnterTimestampMonotonic") or 0)
+    if not entered:
+        return None
+    return time.clock_gettime(time.CLOCK_MONOTONIC) - entered / 1e6
+
+
+def evaluate(args, name, unit, restarts):
+    state = f"{unit.get('ActiveState')} ({unit.get('SubState')})"
+    if unit.get("MainPID", "0") != "0":
+        state += f", Main PID: {unit['MainPID']}"
+    if unit.get("ActiveEnterTimestamp"):
+        state += f", since {unit['ActiveEnterTimestamp']}"
+    if restarts:
+        state += f", {restarts} restarts in {args.restart_window}s"
+
+    if unit.get("LoadState") == "not-found":
+        return 2, f"{name}: not found"
+    if unit.get("ActiveState") in ("failed", "inactive"):
+        return 2, f"{name}: {state}"
+    if restarts >= args.restart_crit:
+        return 2, f"{name}: restart loop, {state}"
+    if unit.get("ActiveState") != "active":
+        return 1, f"{name}: {state}"
+    if restarts >= args.restart_warn:
+        return 1, f"{name}: restarting, {state}"
+    uptime = get_uptime(unit)
+    if args.min_uptime and uptime is not None and uptime < args.min_uptime:
+        return 1, f"{name}: active for {uptime:.0f}s only, {state}"
+    return 0, f"{name}: {state}"
+
+
+def main():
+    args = parse_args()
+    try:
+        units = show_units(args.units, args.timeout)
+    except subprocess.CalledProcessError as ex:
+        print(f"UNKNOWN - systemctl show failed: {ex.stderr.strip() or ex}")
+        sys.exit(3)
+    except (OSError, subprocess.TimeoutExpired) as ex:
+        print(f"UNKNOWN - {ex}")
+        sys.exit(3)
+    restarts = get_restarts(args.units, units, args.restart_window)
+
+    results = [evaluate(args, name, unit, restarts.get(name, 0)) for name, unit in sorted(units.items())]
+    for pattern in args.units:
+        # Plain names always come back, with LoadState=not-found if unknown
+        if not any(char in pattern for char in "*?["):
+            continue
+        if not any(fnmatch.fnmatchcase(name, pattern) for name in units):
+            results.append((2, f"{pattern}: no such unit loaded"))
+    code = max((result[0] for result in results), default=3)
+    counts = {}
+    for result in results:
+        counts[result[0]] = counts.get(result[0], 0) + 1
+    summary = ", ".join(f"{counts[state]} {STATES[state]}" for state in sorted(counts, reverse=True))
+    problems = [message for state, message in results if state]
+    active = sum(1 for unit in units.values() if unit.get("ActiveState") == "active")
+    perfdata = f"units={len(units)} active={active} restarts={sum(restarts.values())}"
+
+    print(f"{STATES[code]} - {len(results)} units: {summary}" + (f", {'; '.join(problems)}" if problems else "") + f" | {perfdata}")
+    for _, message in sorted(results, key=lambda result: -result[0]):
+        print(message)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
-import argparse, sys, requests, logging
+import profiling
+import argparse, sys, logging, json, codecs
+import transport
+import timing
+import deadline
+import upstream_quorum
+import heighthist
 
-assert sys.version_info >= (3, 6), "This script requires Python 3.6 or higher"
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+# https://tronprotocol.github.io/documentation-en/developers/official-public-nodes/
+UPSTREAMS = ["18.139.193.235:8090"]
+UPSTREAM_BUDGET = 8
 
 
 def parse_args():
@@ -28,33 +38,146 @@ def parse_args():
         default=3,
         help="Minimal amount of connected peers, default value is 3",
     )
+    parser.add_argument(
+        "--upstream-ttl",
+        type=int,
+        default=5,
+        help="Seconds to share the upstream block height between checks, 0 disables the cache, default value is 5 sec",
+    )
+    upstream_quorum.add_arguments(parser, UPSTREAMS, UPSTREAM_BUDGET)
+    deadline.add_arguments(parser)
+    heighthist.add_arguments(parser)
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
     return args
 
 
-def get_status(host):
+class JSONStream:
+    # Just enough of an incremental JSON reader to walk an object member by
+    # member: values are decoded one at a time with the C decoder and the
+    # consumed part of the buffer is dropped as more chunks arrive.
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+
+    def more(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos :] + self.text.decode(chunk)
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.more():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self.buf[end - 1] in "0123456789.eE+-" and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def parse_block(block):
+    # "Num:12345,ID:000..." -> 12345
+    return int(block.split(",")[0].split(":")[1])
+
+
+def scan_nodeinfo(chunks, count_peers=True):
+    # Returns (block, active peers) from a /wallet/getnodeinfo body without
+    # building the whole document, peerList entries are counted one by one.
+    stream = JSONStream(chunks)
+    block, npeers, seen_peers = None, 0, False
+    stream.expect("{")
+    if stream.peek() == "}":
+        raise ValueError("Empty getnodeinfo response")
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "peerList" and count_peers:
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    if stream.value().get("active"):
+                        npeers += 1
+                    if stream.expect(",]") == "]":
+                        break
+            seen_peers = True
+        elif key == "block":
+            block = stream.value()
+        else:
+            stream.value()
+        if block is not None and (seen_peers or not count_peers):
+            break
+        if stream.expect(",}") == "}":
+            break
+    if block is None:
+        raise ValueError("No block in getnodeinfo response")
+    return parse_block(block), npeers
+
+
+def fetch_nodeinfo(url, timeout, count_peers=True):
+    with transport.get(url, timeout=timeout, stream=True) as response, timing.decoding(response.timing):
+        return scan_nodeinfo(transport.iter_body(response), count_peers)
+
+
+def get_nodeinfo(url, timeout, count_peers=True):
     try:
-        status = requests.get(f"http://{host}/wallet/getnodeinfo", timeout=3)
+        return fetch_nodeinfo(url, timeout, count_peers)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         logging.info(f"CRITICAL - {ex}")
         sys.exit(2)
 
-    return status.json()
 
+def get_status(host):
+    return get_nodeinfo(f"http://{host}/wallet/getnodeinfo", 3)
+
+
+def fetch_upstream_block(upstream, timeout):
+    block, _ = fetch_nodeinfo(f"http://{upstream}/wallet/getnodeinfo", timeout, count_peers=False)
+    return block
 
-def get_upstream_status():
-    # https://tronprotocol.github.io/documentation-en/developers/official-public-nodes/
-    node = "18.139.193.235:8090"
+
+def get_upstream_block(args):
     try:
-        upstream_status = requests.get(f"http://{node}/wallet/getnodeinfo", timeout=8)
+        return upstream_quorum.get_args_height(args, fetch_upstream_block)
+    except deadline.DeadlineExceeded as ex:
+        deadline.fail(ex)
     except Exception as ex:
         logging.info(f"CRITICAL - {ex}")
         sys.exit(2)
 
-    return upstream_status.json()
-
 
 def main():
     args = parse_args()
@@ -70,40 +193,39 @@ def main():
             level=logging.INFO,
         )
 
+    deadline.start(args.deadline)
     host = args.host
     delta = args.delta
-    upstream_status = get_upstream_status()
-    logging.debug(upstream_status)
-    upstream_block = int(upstream_status["block"].split(",")[0].split(":")[1])
-    logging.debug(f"upstream_block:{upstream_block}")
-    status = get_status(host)
-    logging.debug(f"status:{status}")
-    block = int(status["block"].split(",")[0].split(":")[1])
+    upstream_block, cache_info, quorum_info = get_upstream_block(args)
+    logging.debug(f"upstream_block:{upstream_block}, cache:{cache_info}, quorum:{quorum_info}")
+    with deadline.phase("status"):
+        block, npeers = get_status(host)
     logging.debug(f"block:{block}")
-    peers = status["peerList"]
-    logging.debug(f"peers:{peers}")
-    npeers = 0
-    for peer in peers:
-        if peer["active"]:
-            npeers += 1
-    logging.debug(f"peer:{peer}")
+    logging.debug(f"npeers:{npeers}")
+    transport.log_stats()
     delay = upstream_block - block
-    state = f"Current block: {block}, Upstream block: {upstream_block}"
+    state = f"Current block: {block}, Upstream block: {upstream_block} ({upstream_quorum.describe(cache_info, quorum_info)})"
+    if args.history:
+        trend = heighthist.record(
+            f"tron:{host}", block, upstream_block, args.history_window, delta
+        )
+        logging.debug(f"trend:{trend}")
+        state += f", {heighthist.describe(trend)}"
     npeers_state = f"Only {npeers} peers connected! "
 
     if delay >= delta:
-        logging.info(f"CRITICAL - delta is {delay} blocks. {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - delta is {delay} blocks. {state}"))
         sys.exit(2)
     elif npeers < args.peers:
-        logging.info(f"CRITICAL - {npeers_state}, {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - {npeers_state}, {state}"))
         sys.exit(2)
     elif delay < delta:
-        logging.info(f"OK - {state}, Delta: {delay}")
+        logging.info(timing.append_perfdata(f"OK - {state}, Delta: {delay}"))
         sys.exit(0)
     else:
-        logging.info(f"CRITICAL - {state}")
+        logging.info(timing.append_perfdata(f"CRITICAL - {state}"))
         sys.exit(2)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
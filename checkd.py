@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import argparse, sys, os, io, json, glob, importlib, logging, signal, socketserver, time
+from contextlib import redirect_stdout, redirect_stderr
+import profiling
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+DEFAULT_SOCKET = os.environ.get("NAGIOS_CHECKD_SOCKET", "/tmp/nagios_checkd.sock")
+CHECKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Resident daemon serving check_* plugins over a Unix socket"
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help=f"Path of the Unix socket to listen on, default value is {DEFAULT_SOCKET}",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=int,
+        default=60,
+        help="Kill a check that runs longer than this many seconds, default value is 60",
+    )
+    parser.add_argument(
+        "-n",
+        "--max-children",
+        type=int,
+        default=64,
+        help="Maximal amount of checks running at the same time, default value is 64",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    args = parser.parse_args()
+
+    return args
+
+
+def load_checks(directory=CHECKS_DIR):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    checks = {}
+    for path in sorted(glob.glob(os.path.join(directory, "check_*.py"))):
+        name = os.path.basename(path)[:-3]
+        try:
+            module = importlib.import_module(name)
+        except Exception as ex:
+            logging.warning(f"Skipping {name}: {ex}")
+            continue
+        if not hasattr(module, "main"):
+            logging.warning(f"Skipping {name}: no main()")
+            continue
+        checks[name] = module
+    return checks
+
+
+def run_check(module, argv):
+    # Runs main() the way the CLI would and returns (exit code, stdout, stderr).
+    # The check owns the process while it runs: it configures logging and
+    # finishes with sys.exit().
+    stdout, stderr = io.StringIO(), io.StringIO()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.WARNING)
+    sys.argv = [module.__file__] + list(argv)
+    code = 0
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            profiling.run(module.main)
+        except SystemExit as ex:
+            if ex.code is None:
+                code = 0
+            elif isinstance(ex.code, int):
+                code = ex.code
+            else:
+                print(ex.code, file=sys.stderr)
+                code = 1
+        except Exception as ex:
+            print(f"UNKNOWN - {type(ex).__name__}: {ex}")
+            code = 3
+        logging.shutdown()
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+class CheckHandler(socketserver.StreamRequestHandler):
+    # Runs in a freshly forked child, so the check can't leak state back
+    # into the daemon and a hung check is killed by the alarm.
+    def handle(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        signal.alarm(self.server.check_timeout)
+        try:
+            request = json.loads(self.rfile.readline())
+            name = os.path.basename(request["check"])
+            if name.endswith(".py"):
+                name = name[:-3]
+            argv = request.get("argv", [])
+        except Exception as ex:
+            self.reply(3, f"UNKNOWN - Bad request: {ex}\n", "", 0)
+            return
+        module = self.server.checks.get(name)
+        if module is None:
+            self.reply(3, f"UNKNOWN - Unknown check {name}\n", "", 0)
+            return
+        started = time.monotonic()
+        code, out, err = run_check(module, argv)
+        self.reply(code, out, err, time.monotonic() - started)
+
+    def reply(self, code, out, err, elapsed):
+        response = {"code": code, "stdout": out, "stderr": err, "elapsed": elapsed}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CheckServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def main():
+    args = parse_args()
+
+    if args.debug:
+        logging.basicConfig(
+            format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+            level=logging.DEBUG,
+        )
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            level=logging.INFO,
+        )
+
+    checks = load_checks()
+    logging.info(f"Loaded checks: {', '.join(checks)}")
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = CheckServer(args.socket, CheckHandler)
+    server.checks = checks
+    server.check_timeout = args.timeout
+    server.max_children = args.max_children
+    os.chmod(args.socket, 0o660)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info(f"Listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Thin client for checkd.py: takes the check name followed by the check's own
+# flags, e.g. checkd_client.py check_bsc_node -H 127.1:8545 -p 5
+# Only stdlib modules are imported here to keep startup cheap. If the daemon
+# is not running the check is executed directly.
+
+import json, os, socket, sys
+
+DEFAULT_SOCKET = os.environ.get("NAGIOS_CHECKD_SOCKET", "/tmp/nagios_checkd.sock")
+TIMEOUT = 65
+
+
+def run_local(check, argv):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), check + ".py")
+    os.execv(sys.executable, [sys.executable, script] + argv)
+
+
+def query(sock_path, check, argv):
+    request = json.dumps({"check": check, "argv": argv}).encode() + b"\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(TIMEOUT)
+        sock.connect(sock_path)
+        sock.sendall(request)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def main():
+    argv = sys.argv[1:]
+    sock_path = DEFAULT_SOCKET
+    if argv[:1] == ["--socket"] and len(argv) > 1:
+        sock_path = argv[1]
+        argv = argv[2:]
+    if not argv:
+        print("UNKNOWN - Usage: checkd_client.py [--socket PATH] CHECK [ARGS...]")
+        sys.exit(3)
+    check = os.path.basename(argv[0])
+    if check.endswith(".py"):
+        check = check[:-3]
+
+    try:
+        response = query(sock_path, check, argv[1:])
+    except (FileNotFoundError, ConnectionRefusedError):
+        run_local(check, argv[1:])
+    except Exception as ex:
+        print(f"UNKNOWN - checkd: {ex}")
+        sys.exit(3)
+
+    try:
+        result = json.loads(response)
+    except ValueError:
+        print("UNKNOWN - checkd returned no result, the check was killed or crashed")
+        sys.exit(3)
+    sys.stdout.write(result["stdout"])
+    sys.stderr.write(result["stderr"])
+    sys.exit(result["code"])
+
+
+if __name__ == "__main__":
+    main()
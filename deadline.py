@@ -0,0 +1,123 @@
+# End-to-end time budget of a check. With --deadline every network call
+# takes its timeout from what is left of the budget instead of its own fixed
+# one, so a check with several requests in a row still finishes in time. The
+# time spent is recorded per phase, e.g. status and upstream, and a check
+# that runs out of time reports UNKNOWN with that breakdown rather than a
+# CRITICAL about the node.
+#
+# The deadline is process-wide: a check is one process, under checkd.py a
+# forked child, and all hosts of a --hosts run share it.
+
+import sys, time, threading
+from contextlib import contextmanager
+
+_deadline = None
+_seconds = None
+_phases = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=0,
+        help="Seconds the whole check may take, shared by all of its requests, set it below the service_check_timeout of Nagios, 0 keeps the fixed timeouts, default value is 0",
+    )
+
+
+def start(seconds):
+    global _deadline, _seconds
+    with _lock:
+        _phases.clear()
+        if seconds and seconds > 0:
+            _deadline = time.monotonic() + seconds
+            _seconds = seconds
+        else:
+            _deadline = _seconds = None
+
+
+def remaining():
+    # Seconds left, None without a deadline
+    if _deadline is None:
+        return None
+    return _deadline - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def exceeded():
+    return DeadlineExceeded(f"Deadline of {_seconds:g}s exceeded, {describe()}")
+
+
+def check():
+    if expired():
+        raise exceeded()
+
+
+def timeout(value=None):
+    # value capped to what is left of the deadline, value itself without one
+    left = remaining()
+    if left is None:
+        return value
+    check()
+    if value is None:
+        return left
+    if isinstance(value, tuple):
+        return tuple(left if part is None else min(part, left) for part in value)
+    return min(value, left)
+
+
+@contextmanager
+def phase(name):
+    entry = [name, time.monotonic(), None]
+    with _lock:
+        _phases.append(entry)
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(name)
+    try:
+        yield
+    finally:
+        entry[2] = time.monotonic()
+        stack.pop()
+
+
+def phased(name, function):
+    # function running in phase name, for work handed to other threads, which
+    # don't see the phases of the thread submitting it
+    def run(*args, **kwargs):
+        with phase(name):
+            return function(*args, **kwargs)
+
+    return run
+
+
+def current():
+    # Innermost phase of this thread, None outside of any
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def describe():
+    # "status 0.21s, upstream 2.79s (unfinished)"
+    now = time.monotonic()
+    with _lock:
+        phases = list(_phases)
+    if not phases:
+        return "no phase recorded"
+    return ", ".join(
+        f"{name} {(end or now) - started:.2f}s" + ("" if end else " (unfinished)") for name, started, end in phases
+    )
+
+
+def fail(ex):
+    print(f"UNKNOWN - {ex}")
+    sys.exit(3)
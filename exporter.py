@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+# Prometheus/OpenMetrics exporter built on the fetch and parse functions of
+# the check_* scripts. Targets are polled in the background by a bounded
+# worker pool and /metrics only renders the last results, so a scrape never
+# talks to a node.
+#
+# Targets come from a JSON file, e.g.
+# [
+#   {"check": "bsc", "host": "127.1:8545", "upstreams": ["https://bsc-dataseed1.binance.org", "https://bsc-dataseed2.binance.org"]},
+#   {"check": "gaia", "host": "10.0.0.5:26657"},
+#   {"check": "tron", "host": "127.1:8090", "upstreams": ["10.0.0.8:8090", "10.0.0.9:8090"], "quorum": 1},
+#   {"check": "redis", "host": "127.0.0.1:6379", "metrics": ["used_memory", "connected_clients"]}
+# ]
+
+import argparse, sys, re, json, time, logging, threading, types
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rfc3339
+import transport
+import upstream_quorum
+import check_binance_node, check_bsc_node, check_decimalchain_node, check_gaia_node
+import check_minter_node, check_monero_node, check_prizm_node, check_tron_node
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+HELP = {
+    "node_block_height": "Latest block height of the node",
+    "node_upstream_block_height": "Latest block height of the upstream node",
+    "node_block_delta": "Blocks the node is behind its upstream",
+    "node_peers": "Connected peers",
+    "node_catching_up": "1 if the node is catching up",
+    "node_block_age_seconds": "Seconds since the latest block time",
+    "node_voting_power": "Voting power of the validator",
+    "exporter_target_up": "1 if the last poll of the target succeeded",
+    "exporter_poll_duration_seconds": "Duration of the last poll of the target",
+    "exporter_last_poll_timestamp_seconds": "Time of the last poll of the target",
+    "exporter_http_requests_total": "HTTP requests sent to the origin",
+    "exporter_http_connections_total": "HTTP connections opened to the origin, the rest of the requests reused one",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prometheus exporter for the check_* scripts")
+    parser.add_argument("-c", "--config", required=True, help="JSON file with the list of targets")
+    parser.add_argument(
+        "-l",
+        "--listen",
+        default="0.0.0.0:9810",
+        help="Address and port to serve /metrics on, default value is 0.0.0.0:9810",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=30,
+        help="Seconds between polls of each target, default value is 30",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="Maximal amount of targets polled at the same time, default value is 8",
+    )
+    parser.add_argument(
+        "--upstream-ttl",
+        type=int,
+        default=5,
+        help="Seconds to share upstream block heights between targets and checks, default value is 5 sec",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    args = parser.parse_args()
+
+    return args
+
+
+def collect_tendermint(module, target, args, peers=False):
+    # peers reads /net_info too, only for checks that do so themselves
+    status = module.fetch_status(target["host"])
+    sync_info = status["result"]["sync_info"]
+    _, age = rfc3339.parse_age(sync_info["latest_block_time"])
+    gauges = {
+        "node_block_height": int(sync_info["latest_block_height"]),
+        "node_catching_up": int(sync_info["catching_up"] != False),
+        "node_block_age_seconds": age.total_seconds(),
+    }
+    if peers:
+        gauges["node_peers"] = int(module.fetch_netinfo(target["host"])["result"]["n_peers"])
+    validator_info = status["result"].get("validator_info", {})
+    if "voting_power" in validator_info:
+        gauges["node_voting_power"] = int(validator_info["voting_power"])
+    return gauges
+
+
+def collect_gaia(target, args):
+    return collect_tendermint(check_gaia_node, target, args)
+
+
+def collect_binance(target, args):
+    return collect_tendermint(check_binance_node, target, args)
+
+
+def collect_decimalchain(target, args):
+    return collect_tendermint(check_decimalchain_node, target, args, peers=True)
+
+
+def collect_minter(target, args):
+    status = check_minter_node.fetch_status(target["host"])
+    _, age = rfc3339.parse_age(status["latest_block_time"])
+    return {
+        "node_block_height": int(status["latest_block_height"]),
+        "node_catching_up": int(status["catching_up"] != False),
+        "node_block_age_seconds": age.total_seconds(),
+    }
+
+
+def with_upstream(gauges, upstream_block):
+    gauges["node_upstream_block_height"] = upstream_block
+    gauges["node_block_delta"] = upstream_block - gauges["node_block_height"]
+    return gauges
+
+
+def upstream_height(module, target, args):
+    # Upstreams of the target, "upstream" is a single one, defaults of the check otherwise
+    upstreams = target.get("upstreams") or ([target["upstream"]] if "upstream" in target else module.UPSTREAMS)
+    height, _, _ = upstream_quorum.get_cached_height(
+        upstreams,
+        module.fetch_upstream_block,
+        args.upstream_ttl,
+        target.get("quorum", 2),
+        target.get("upstream_budget", module.UPSTREAM_BUDGET),
+    )
+    return height
+
+
+def collect_bsc(target, args):
+    is_catching_up, peers, block = check_bsc_node.fetch_status(
+        target["host"], ["eth_syncing", "net_peerCount", "eth_blockNumber"]
+    )
+    gauges = {
+        "node_block_height": int(block, 16),
+        "node_peers": int(peers, 16),
+        "node_catching_up": int(is_catching_up != False),
+    }
+    return with_upstream(gauges, upstream_height(check_bsc_node, target, args))
+
+
+def collect_tron(target, args):
+    block, peers = check_tron_node.fetch_nodeinfo(
+        f"http://{target['host']}/wallet/getnodeinfo", 3
+    )
+    gauges = {"node_block_height": block, "node_peers": peers}
+    return with_upstream(gauges, upstream_height(check_tron_node, target, args))
+
+
+def collect_monero(target, args):
+    status = check_monero_node.fetch_status(target["host"])
+    gauges = {"node_block_height": int(status["result"]["count"])}
+    return with_upstream(gauges, upstream_height(check_monero_node, target, args))
+
+
+def collect_prizm(target, args):
+    state = check_prizm_node.fetch_state(check_prizm_node.get_node_url(target["host"]), 2)
+    gauges = {
+        "node_block_height": state["numberOfBlocks"],
+        "node_catching_up": int(state["blockchainState"] != "UP_TO_DATE"),
+    }
+    return with_upstream(gauges, upstream_height(check_prizm_node, target, args))
+
+
+def metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def collect_redis(target, args):
+    # redis is only needed when redis targets are configured
+    import check_redis
+
+    options = types.SimpleNamespace(
+        host=target["host"], password=target.get("password"), timeout=target.get("timeout", 5)
+    )
+    stats = check_redis.get_client(options).info()
+    gauges = {}
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            # keyspace: db0 -> {keys, expires, avg_ttl}
+            for field, nested in value.items():
+                if isinstance(nested, (int, float)):
+                    gauges[metric_name(f"redis_{name}_{field}")] = nested
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauges[metric_name(f"redis_{name}")] = value
+    if target.get("metrics"):
+        wanted = {metric_name(f"redis_{metric}") for metric in target["metrics"]}
+        gauges = {name: value for name, value in gauges.items() if name in wanted}
+    return gauges
+
+
+COLLECTORS = {
+    "gaia": collect_gaia,
+    "binance": collect_binance,
+    "decimalchain": collect_decimalchain,
+    "minter": collect_minter,
+    "bsc": collect_bsc,
+    "tron": collect_tron,
+    "monero": collect_monero,
+    "prizm": collect_prizm,
+    "redis": collect_redis,
+}
+
+
+class Exporter:
+    def __init__(self, targets, args):
+        self.targets = targets
+        self.args = args
+        self.lock = threading.Lock()
+        self.results = {}
+        self.running = set()
+
+    def poll(self, target):
+        key = (target["check"], target["host"])
+        started = time.monotonic()
+        try:
+            gauges = COLLECTORS[target["check"]](target, self.args)
+            up = 1
+        except Exception as ex:
+            logging.warning(f"{target['check']} {target['host']}: {ex}")
+            gauges, up = {}, 0
+        gauges["exporter_target_up"] = up
+        gauges["exporter_poll_duration_seconds"] = time.monotonic() - started
+        gauges["exporter_last_poll_timestamp_seconds"] = time.time()
+        with self.lock:
+            self.results[key] = gauges
+            self.running.discard(key)
+
+    def schedule(self):
+        with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+            while True:
+                started = time.monotonic()
+                for target in self.targets:
+                    key = (target["check"], target["host"])
+                    with self.lock:
+                        # A target still busy from the previous round is skipped
+                        if key in self.running:
+                            continue
+                        self.running.add(key)
+                    executor.submit(self.poll, target)
+                time.sleep(max(0, self.args.interval - (time.monotonic() - started)))
+
+    def render(self):
+        with self.lock:
+            results = dict(self.results)
+        families = {}
+        for (check, host), gauges in sorted(results.items()):
+            labels = f'check="{escape(check)}",host="{escape(host)}"'
+            for name, value in gauges.items():
+                families.setdefault(name, []).append(f"{name}{{{labels}}} {value!r}")
+        for origin, counts in sorted(transport.stats().items()):
+            labels = f'origin="{escape(origin)}"'
+            for name, key in (("exporter_http_requests_total", "requests"), ("exporter_http_connections_total", "connections")):
+                families.setdefault(name, []).append(f"{name}{{{labels}}} {counts[key]}")
+        lines = []
+        for name in sorted(families):
+            lines.append(f"# HELP {name} {HELP.get(name, name.replace('_', ' '))}")
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.extend(families[name])
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def main():
+    args = parse_args()
+
+    if args.debug:
+        logging.basicConfig(
+            format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+            level=logging.DEBUG,
+        )
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            level=logging.INFO,
+        )
+
+    with open(args.config) as f:
+        targets = json.load(f)
+    for target in targets:
+        if target.get("check") not in COLLECTORS:
+            logging.error(f"Unknown check {target.get('check')}, expected one of {', '.join(COLLECTORS)}")
+            sys.exit(2)
+
+    exporter = Exporter(targets, args)
+    threading.Thread(target=exporter.schedule, daemon=True).start()
+
+    address, _, port = args.listen.rpartition(":")
+    server = ThreadingHTTPServer((address, int(port)), MetricsHandler)
+    server.exporter = exporter
+    logging.info(f"Serving /metrics on {args.listen} for {len(targets)} targets")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Per-host block height history in a fixed-size memory-mapped ring buffer of
+# (timestamp, local height, upstream height) samples. Checks append one sample
+# per run and derive block rate, lag trend and time to stall from the samples
+# of the last --history-window seconds, reading only the newest records.
+
+import os, mmap, fcntl, struct, time
+from statefile import state_path
+
+MAGIC = b"NAGHIST1"
+HEADER = struct.Struct("<8sIIQ")  # magic, capacity, reserved, samples written
+RECORD = struct.Struct("<dqq")  # timestamp, local height, upstream height
+DEFAULT_CAPACITY = 1024
+NO_UPSTREAM = -1
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="Keep a block height history of the node and report block rate, lag trend and time to stall",
+    )
+    parser.add_argument(
+        "--history-window",
+        type=int,
+        default=600,
+        help="Seconds of history used for the trend, default value is 600",
+    )
+
+
+class HeightHistory:
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        size = HEADER.size + capacity * RECORD.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        if os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, 0)
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        magic, self.capacity, _, self.written = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or self.capacity != capacity:
+            self.capacity, self.written = capacity, 0
+            HEADER.pack_into(self.map, 0, MAGIC, capacity, 0, 0)
+
+    def close(self):
+        self.map.close()
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, timestamp, local, upstream=NO_UPSTREAM):
+        offset = HEADER.size + (self.written % self.capacity) * RECORD.size
+        RECORD.pack_into(self.map, offset, timestamp, local, upstream)
+        self.written += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.capacity, 0, self.written)
+
+    def samples(self, since=0):
+        # Newest first walk, stops at the first sample older than since
+        result = []
+        for i in range(min(self.written, self.capacity)):
+            index = (self.written - 1 - i) % self.capacity
+            sample = RECORD.unpack_from(self.map, HEADER.size + index * RECORD.size)
+            if sample[0] < since:
+                break
+            result.append(sample)
+        result.reverse()
+        return result
+
+
+def get_trend(samples, limit=None):
+    # Rates between the oldest and newest sample of the window. time_to_stall
+    # is when the lag reaches limit blocks at the current lag growth.
+    if len(samples) < 2 or samples[-1][0] <= samples[0][0]:
+        return None
+    (t0, local0, upstream0), (t1, local1, upstream1) = samples[0], samples[-1]
+    elapsed = t1 - t0
+    trend = {"rate": (local1 - local0) / elapsed, "lag_trend": None, "time_to_stall": None}
+    if upstream0 != NO_UPSTREAM and upstream1 != NO_UPSTREAM:
+        trend["lag_trend"] = ((upstream1 - local1) - (upstream0 - local0)) / elapsed
+        lag = upstream1 - local1
+        if limit is not None and trend["lag_trend"] > 0 and lag < limit:
+            trend["time_to_stall"] = (limit - lag) / trend["lag_trend"]
+    # Seconds since the local height last moved
+    trend["stalled_for"] = 0.0
+    for t, local, _ in reversed(samples):
+        if local != local1:
+            break
+        trend["stalled_for"] = t1 - t
+    return trend
+
+
+def describe(trend):
+    if trend is None:
+        return "trend: collecting history"
+    parts = [f"{trend['rate']:.2f} blocks/s"]
+    if trend["lag_trend"] is not None:
+        parts.append(f"lag {trend['lag_trend']:+.3f} blocks/s")
+    if trend["time_to_stall"] is not None:
+        parts.append(f"delta limit in {trend['time_to_stall']:.0f}s")
+    if trend["stalled_for"]:
+        parts.append(f"no new block for {trend['stalled_for']:.0f}s")
+    return "trend: " + ", ".join(parts)
+
+
+def record(key, local, upstream=NO_UPSTREAM, window=600, limit=None):
+    # Appends a sample for key and returns the trend over the last window
+    now = time.time()
+    with HeightHistory(state_path("history", key)) as history:
+        history.append(now, int(local), int(upstream))
+        return get_trend(history.samples(now - window), limit)
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+
+# Local stand-ins for every API the checks talk to, for benchmarks and manual
+# testing without live nodes. One HTTP server answers all the plain HTTP APIs
+# by path, a TLS server answers Prizm on its fixed port 9976 and a small RESP
+# server plays Redis. Every server can add latency, grow the payload and
+# inject failures.
+#
+#   GET  /status, /net_info           Tendermint (gaia, binance, decimalchain)
+#   GET  /websocket                   Tendermint NewBlock(Header) subscription
+#   GET  /v2/status                   Minter
+#   POST /                            Ethereum JSON-RPC, single and batch (bsc)
+#   GET  /wallet/getnodeinfo          Tron
+#   GET  /json_rpc                    Monero get_block_count
+#   GET  /prizm?requestType=getState  Prizm (TLS)
+
+import argparse, sys, os, json, time, random, base64, hashlib, socket, ssl, struct, subprocess, tempfile, threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socketserver
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+FAILURES = ("error", "drop", "hang")
+BLOCK_TIME = 3
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class MockConfig:
+    def __init__(self, latency=0, peers=10, fail_rate=0.0, failure="error", keys=1000):
+        self.latency = latency  # milliseconds per request
+        self.peers = peers  # peers in net_info/getnodeinfo, the payload size knob
+        self.fail_rate = fail_rate  # fraction of requests that fail
+        self.failure = failure  # error: HTTP 500, drop: close the connection, hang: never answer
+        self.keys = keys  # keys in the Redis stand-in
+
+    def should_fail(self):
+        return self.fail_rate > 0 and random.random() < self.fail_rate
+
+
+def height():
+    return int(time.time() // BLOCK_TIME)
+
+
+def block_time():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+def synthetic_peer(i, active=True):
+    return {
+        "lastSyncBlock": f"Num:{height()},ID:0000000003a66b87a4f6c4e7e1b1d0f2c1d5f33e4d1a2c3b4a5968778695a4b3",
+        "remainNum": 0,
+        "lastBlockUpdateTime": 1700000000000,
+        "syncFlag": True,
+        "headBlockTimeWeBothHave": 1700000000000,
+        "needSyncFromPeer": False,
+        "needSyncFromUs": False,
+        "host": f"10.0.{i // 256 % 256}.{i % 256}",
+        "port": 18888,
+        "nodeId": "f" * 128,
+        "connectTime": 1700000000000,
+        "avgLatency": 12.5,
+        "syncToFetchSize": 0,
+        "syncToFetchSizePeekNum": -1,
+        "syncBlockRequestedSize": 0,
+        "unFetchSynNum": 0,
+        "blockInPorcSize": 0,
+        "headBlockWeBothHave": f"Num:{height()},ID:0000000003a66b87a4f6c4e7e1b1d0f2c1d5f33e4d1a2c3b4a5968778695a4b3",
+        "isActive": active,
+        "score": 100,
+        "nodeCount": 1,
+        "inFlow": 123456789,
+        "disconnectTimes": 0,
+        "localDisconnectReason": "",
+        "remoteDisconnectReason": "",
+        "active": active,
+    }
+
+
+def tron_nodeinfo(peers):
+    return {
+        "activeConnectCount": peers,
+        "beginSyncNum": height() - 500,
+        "block": f"Num:{height()},ID:0000000003a66b87a4f6c4e7e1b1d0f2c1d5f33e4d1a2c3b4a5968778695a4b3",
+        "cheatWitnessInfoMap": {},
+        "configNodeInfo": {"codeVersion": "4.7.3", "p2pVersion": "11111", "listenPort": 18888},
+        "currentConnectCount": peers,
+        "machineInfo": {"cpuCount": 32, "freeMemory": 1 << 34, "javaVersion": "1.8.0"},
+        "passiveConnectCount": 0,
+        "peerList": [synthetic_peer(i, active=i % 4 != 0) for i in range(peers)],
+        "solidityBlock": f"Num:{height() - 19},ID:0000000003a66b74",
+        "totalFlow": 987654321,
+    }
+
+
+def tendermint_status():
+    return {
+        "jsonrpc": "2.0",
+        "id": -1,
+        "result": {
+            "node_info": {"network": "mock-1", "version": "0.34.27", "moniker": "mock"},
+            "sync_info": {
+                "latest_block_hash": "A" * 64,
+                "latest_block_height": str(height()),
+                "latest_block_time": block_time(),
+                "catching_up": False,
+            },
+            "validator_info": {"address": "B" * 40, "voting_power": "1000"},
+        },
+    }
+
+
+def tendermint_netinfo(peers):
+    return {
+        "jsonrpc": "2.0",
+        "id": -1,
+        "result": {
+            "listening": True,
+            "n_peers": str(peers),
+            "peers": [
+                {
+                    "node_info": {"id": f"{i:040x}", "listen_addr": f"tcp://10.0.0.{i % 256}:26656", "moniker": f"peer{i}"},
+                    "is_outbound": i % 2 == 0,
+                    "remote_ip": f"10.0.0.{i % 256}",
+                }
+                for i in range(peers)
+            ],
+        },
+    }
+
+
+def eth_result(method):
+    return {
+        "eth_syncing": False,
+        "net_peerCount": hex(25),
+        "eth_blockNumber": hex(height()),
+    }.get(method)
+
+
+class MockHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, Nagle would delay keep-alive replies
+    disable_nagle_algorithm = True
+
+    def fail_or_wait(self):
+        # Returns True when the request was answered with an injected failure
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency / 1000)
+        if not config.should_fail():
+            return False
+        if config.failure == "hang":
+            time.sleep(3600)
+        elif config.failure == "drop":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+        else:
+            self.reply(500, {"error": "injected failure"})
+        return True
+
+    def reply(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def do_GET(self):
+        request = self.read_body()
+        if self.fail_or_wait():
+            return
+        path = self.path.split("?")[0]
+        peers = self.server.config.peers
+        if path == "/websocket":
+            self.websocket()
+        elif path == "/status":
+            self.reply(200, tendermint_status())
+        elif path == "/net_info":
+            self.reply(200, tendermint_netinfo(peers))
+        elif path == "/v2/status":
+            sync_info = tendermint_status()["result"]["sync_info"]
+            self.reply(200, sync_info)
+        elif path == "/wallet/getnodeinfo":
+            self.reply(200, tron_nodeinfo(peers))
+        elif path == "/json_rpc":
+            request_id = request["id"] if request else "0"
+            self.reply(200, {"jsonrpc": "2.0", "id": request_id, "result": {"count": height(), "status": "OK"}})
+        elif path == "/prizm":
+            self.reply(200, {"blockchainState": "UP_TO_DATE", "numberOfBlocks": height()})
+        else:
+            self.reply(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        request = self.read_body()
+        if self.fail_or_wait():
+            return
+        if isinstance(request, list):
+            self.reply(200, [{"jsonrpc": "2.0", "id": call["id"], "result": eth_result(call["method"])} for call in request])
+        else:
+            self.reply(200, {"jsonrpc": "2.0", "id": request["id"], "result": eth_result(request["method"])})
+
+    def websocket(self):
+        # Pushes a block event whenever height() moves on, to every subscription
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WS_GUID).encode()).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        lock = threading.Lock()
+        subscriptions = {}
+        closed = threading.Event()
+
+        def send(opcode, payload):
+            size = len(payload)
+            if size < 126:
+                header = struct.pack(">BB", 0x80 | opcode, size)
+            elif size < 1 << 16:
+                header = struct.pack(">BBH", 0x80 | opcode, 126, size)
+            else:
+                header = struct.pack(">BBQ", 0x80 | opcode, 127, size)
+            with lock:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+
+        def receive():
+            try:
+                while True:
+                    first, second = self.rfile.read(2)
+                    size = second & 0x7F
+                    if size == 126:
+                        size = struct.unpack(">H", self.rfile.read(2))[0]
+                    elif size == 127:
+                        size = struct.unpack(">Q", self.rfile.read(8))[0]
+                    mask = self.rfile.read(4)
+                    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(self.rfile.read(size)))
+                    opcode = first & 0x0F
+                    if opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        send(0xA, payload)
+                    elif opcode == 0x1:
+                        request = json.loads(payload)
+                        if request.get("method") == "subscribe":
+                            subscriptions[request["id"]] = request["params"]["query"]
+                        send(0x1, json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": {}}).encode())
+            except (OSError, ValueError):
+                pass
+            closed.set()
+
+        threading.Thread(target=receive, daemon=True).start()
+        last = height()
+        try:
+            while not closed.wait(0.1):
+                if height() == last:
+                    continue
+                last = height()
+                header = {"chain_id": "mock-1", "height": str(last), "time": block_time()}
+                for request_id, query in list(subscriptions.items()):
+                    if "NewBlockHeader" in query:
+                        data = {"type": "tendermint/event/NewBlockHeader", "value": {"header": header}}
+                    else:
+                        data = {"type": "tendermint/event/NewBlock", "value": {"block": {"header": header, "data": {"txs": []}}}}
+                    event = {"jsonrpc": "2.0", "id": request_id, "result": {"query": query, "data": data}}
+                    send(0x1, json.dumps(event).encode())
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    # RESP2 stand-in with the commands check_redis and check_redis_bigkeys use
+    # Pipelined replies are many small writes, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            config = self.server.config
+            if config.latency:
+                time.sleep(config.latency / 1000)
+            if config.should_fail():
+                if config.failure == "hang":
+                    time.sleep(3600)
+                elif config.failure == "drop":
+                    return
+                self.wfile.write(b"-ERR injected failure\r\n")
+                continue
+            self.wfile.write(self.execute(command))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def execute(self, command):
+        name = command[0].upper()
+        args = command[1:]
+        keys = self.server.config.keys
+        if name in (b"PING",):
+            return b"+PONG\r\n"
+        if name in (b"CLIENT", b"SELECT", b"AUTH"):
+            return b"+OK\r\n"
+        if name == b"HELLO":
+            # Every other reply is the same in RESP2 and RESP3, only HELLO
+            # answers with a map for RESP3
+            proto = int(args[0]) if args else 2
+            if proto not in (2, 3):
+                return b"-NOPROTO unsupported protocol version\r\n"
+            fields = [b"server", b"redis", b"version", b"7.2.4", b"proto", proto, b"mode", b"standalone", b"role", b"master"]
+            header = b"%%%d\r\n" % (len(fields) // 2) if proto == 3 else b"*%d\r\n" % len(fields)
+            return header + b"".join(b":%d\r\n" % field if isinstance(field, int) else bulk(field) for field in fields)
+        if name == b"DBSIZE":
+            return b":%d\r\n" % keys
+        if name == b"INFO":
+            return bulk(self.info().encode())
+        if name == b"TYPE":
+            return b"+string\r\n"
+        if name == b"MEMORY":
+            index = int(args[1].rsplit(b":", 1)[1])
+            # A few big keys so that the big key check has something to find
+            size = 50 << 20 if index % 997 == 0 else 64 + index % 1000
+            return b":%d\r\n" % size
+        if name == b"SCAN":
+            cursor = int(args[0])
+            count = 10
+            for option, value in zip(args[1::2], args[2::2]):
+                if option.upper() == b"COUNT":
+                    count = int(value)
+            end = min(cursor + count, keys)
+            batch = [b"key:%d" % i for i in range(cursor, end)]
+            next_cursor = b"0" if end >= keys else str(end).encode()
+            return b"*2\r\n" + bulk(next_cursor) + b"*%d\r\n" % len(batch) + b"".join(bulk(key) for key in batch)
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    def info(self):
+        now = time.time()
+        fields = {
+            "redis_version": "7.2.4",
+            "uptime_in_seconds": int(now - self.server.started),
+            "connected_clients": 12,
+            "blocked_clients": 0,
+            "maxclients": 10000,
+            "used_memory": 104857600,
+            "used_memory_rss": 125829120,
+            "mem_fragmentation_ratio": 1.2,
+            "maxmemory": 0,
+            "rdb_changes_since_last_save": 42,
+            "total_connections_received": int(now) % 100000,
+            "total_commands_processed": int(now * 100),
+            "instantaneous_ops_per_sec": 100,
+            "total_net_input_bytes": int(now * 1000),
+            "total_net_output_bytes": int(now * 4000),
+            "rejected_connections": 0,
+            "expired_keys": int(now) % 1000,
+            "evicted_keys": 0,
+            "keyspace_hits": int(now * 90),
+            "keyspace_misses": int(now * 10),
+            "role": "master",
+            "connected_slaves": 0,
+            "used_cpu_sys": 12.5,
+            "used_cpu_user": 30.25,
+        }
+        lines = ["# Mock"] + [f"{name}:{value}" for name, value in fields.items()]
+        lines.append(f"db0:keys={self.server.config.keys},expires=0,avg_ttl=0")
+        return "\r\n".join(lines) + "\r\n"
+
+
+def bulk(value):
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def self_signed_context(directory):
+    # Prizm is only reachable over HTTPS; the checks don't verify the certificate
+    key, cert = os.path.join(directory, "key.pem"), os.path.join(directory, "cert.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-subj", "/CN=localhost", "-days", "1", "-keyout", key, "-out", cert],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_http(config, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), MockHTTPHandler)
+    server.daemon_threads = True
+    server.config = config
+    return serve(server)
+
+
+def start_prizm(config, host="127.0.0.1", port=9976):
+    server = ThreadingHTTPServer((host, port), MockHTTPHandler)
+    server.daemon_threads = True
+    server.config = config
+    directory = tempfile.mkdtemp()
+    try:
+        server.socket = self_signed_context(directory).wrap_socket(server.socket, server_side=True)
+    finally:
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+    return serve(server)
+
+
+def start_redis(config, host="127.0.0.1", port=0):
+    server = RedisServer((host, port), RedisHandler)
+    server.config = config
+    server.started = time.time()
+    return serve(server)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mock chain APIs and Redis for the check_* scripts")
+    parser.add_argument("--http-port", type=int, default=18080, help="Port of the HTTP APIs, default value is 18080")
+    parser.add_argument("--redis-port", type=int, default=16379, help="Port of the Redis stand-in, default value is 16379")
+    parser.add_argument("--no-prizm", action="store_true", help="Don't start the Prizm TLS server on port 9976")
+    parser.add_argument("-l", "--latency", type=int, default=0, help="Milliseconds of latency per request, default value is 0")
+    parser.add_argument("-p", "--peers", type=int, default=10, help="Peers in net_info and getnodeinfo, default value is 10")
+    parser.add_argument("-k", "--keys", type=int, default=1000, help="Keys in the Redis stand-in, default value is 1000")
+    parser.add_argument("-f", "--fail-rate", type=float, default=0, help="Fraction of requests that fail, default value is 0")
+    parser.add_argument("--failure", choices=FAILURES, default="error", help="How requests fail, default value is error")
+    args = parser.parse_args()
+
+    return args
+
+
+def main():
+    args = parse_args()
+    config = MockConfig(args.latency, args.peers, args.fail_rate, args.failure, args.keys)
+    start_http(config, port=args.http_port)
+    start_redis(config, port=args.redis_port)
+    print(f"HTTP APIs on 127.0.0.1:{args.http_port}, Redis on 127.0.0.1:{args.redis_port}")
+    if not args.no_prizm:
+        start_prizm(config)
+        print("Prizm on https://127.0.0.1:9976")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Multi-host mode for checks that poll one --host: all hosts are checked
+# concurrently from one process and reported as one Nagios result per host,
+# optionally preceded by an aggregated summary line.
+
+import sys, asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import deadline
+
+STATES = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+SEVERITY = {0: 0, 1: 1, 3: 2, 2: 3}
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--hosts",
+        action="append",
+        help="Comma separated list of hosts to check at once, can be specified multiple times",
+    )
+    parser.add_argument("--host-file", help="File with one host to check per line")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Maximal amount of hosts polled at the same time, default value is 16",
+    )
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help="Print a summary line with the worst state before the per-host results",
+    )
+
+
+def get_hosts(args):
+    hosts = []
+    for value in args.hosts or []:
+        hosts.extend(host.strip() for host in value.split(",") if host.strip())
+    if args.host_file:
+        with open(args.host_file) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    hosts.append(line)
+    return hosts
+
+
+def worst(codes):
+    return max(codes, key=lambda code: SEVERITY.get(code, SEVERITY[3]), default=3)
+
+
+def check_host(check, host):
+    try:
+        with deadline.phase(host):
+            return check(host)
+    except deadline.DeadlineExceeded as ex:
+        return 3, f"UNKNOWN - {ex}"
+    except Exception as ex:
+        return 2, f"CRITICAL - {ex}"
+
+
+async def poll(check, hosts, concurrency):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    # requests is blocking, so the actual I/O runs in a bounded thread pool
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def one(host):
+            async with semaphore:
+                return await loop.run_in_executor(executor, check_host, check, host)
+
+        return await asyncio.gather(*(one(host) for host in hosts))
+
+
+def run(check, hosts, concurrency=16, aggregate=False):
+    # check(host) returns (exit code, "STATE - message") or raises
+    results = asyncio.run(poll(check, hosts, concurrency))
+    code = worst([result[0] for result in results])
+    lines = [f"{host}: {message}" for host, (_, message) in zip(hosts, results)]
+    if aggregate:
+        counts = {}
+        for result in results:
+            counts[result[0]] = counts.get(result[0], 0) + 1
+        summary = ", ".join(
+            f"{counts[state]} {STATES[state]}"
+            for state in sorted(counts, key=lambda state: -SEVERITY.get(state, 2))
+        )
+        lines.insert(0, f"{STATES.get(code, 'UNKNOWN')} - {len(hosts)} hosts checked: {summary}")
+    print("\n".join(lines))
+    sys.exit(code)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+# Runs the check_* plugins on their own intervals and hands the results to
+# Nagios as passive check results in batches, so the core only ingests them
+# and never forks a plugin. Checks are imported once and every run is a
+# fork() of this process, like in checkd.py.
+#
+# Services come from a JSON file, e.g.
+# [
+#   {"host_name": "bsc1", "service_description": "BSC node", "check": "check_bsc_node",
+#    "args": ["-H", "10.0.0.1:8545"], "interval": 60},
+#   {"host_name": "redis1", "service_description": "Redis memory", "check": "check_redis",
+#    "args": ["-H", "10.0.0.2:6379", "-M", "used_memory,1e9,2e9"]}
+# ]
+#
+# Results go either to the external command file (--command-file), in writes
+# of at most PIPE_BUF bytes that the FIFO keeps whole, or to the check result
+# spool (--spool-dir), one file per batch published by its .ok marker.
+
+import argparse, sys, os, json, time, errno, heapq, logging, random, select, signal, string
+
+import checkd
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+STATES = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+MAX_PENDING = 100000
+SPOOL_CHARS = string.ascii_letters + string.digits
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run check_* plugins and submit passive results to Nagios in batches")
+    parser.add_argument("-c", "--config", required=True, help="JSON file with the list of services")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--command-file", help="Nagios external command file, e.g. /usr/local/nagios/var/rw/nagios.cmd")
+    output.add_argument("--spool-dir", help="Nagios check_result_path, e.g. /usr/local/nagios/var/spool/checkresults")
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=60,
+        help="Seconds between runs of services without their own interval, default value is 60",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=int,
+        default=60,
+        help="Kill a check that runs longer than this many seconds, default value is 60",
+    )
+    parser.add_argument(
+        "-n",
+        "--max-children",
+        type=int,
+        default=64,
+        help="Maximal amount of checks running at the same time, default value is 64",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=2,
+        help="Maximal seconds a result waits for its batch, default value is 2",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Submit a batch as soon as it has this many results, default value is 500",
+    )
+    parser.add_argument("--once", action="store_true", help="Run every service once, submit the results and exit")
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
+    args = parser.parse_args()
+
+    return args
+
+
+def check_name(service, key):
+    # Names go into external commands and result files unescaped, a ; or a
+    # line break would split them into other fields or commands
+    value = service.get(key)
+    if not isinstance(value, str) or not value or any(char in value for char in ";\r\n"):
+        raise ValueError(f"Invalid {key} {value!r}, it must be a non-empty string without ; or line breaks")
+
+
+def escape_output(output):
+    # Passive results are one line, Nagios turns \n back into line breaks
+    return output.strip().replace("\\", "\\\\").replace("\n", "\\n")
+
+
+class CommandFileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def format(self, result):
+        return (
+            f"[{int(result['finish'])}] PROCESS_SERVICE_CHECK_RESULT;"
+            f"{result['host_name']};{result['service_description']};{result['code']};"
+            f"{escape_output(result['output'])}\n"
+        ).encode()
+
+    def write(self, results):
+        # Writes to a FIFO of up to PIPE_BUF bytes are never interleaved with
+        # other writers, so results are packed into chunks of that size
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as ex:
+            if ex.errno == errno.ENXIO:
+                raise OSError(f"Nobody reads {self.path}, is Nagios running?") from ex
+            raise
+        try:
+            os.set_blocking(fd, True)
+            chunk = b""
+            for result in results:
+                line = self.format(result)
+                if len(line) > select.PIPE_BUF:
+                    line = line[: select.PIPE_BUF - 1] + b"\n"
+                if len(chunk) + len(line) > select.PIPE_BUF:
+                    os.write(fd, chunk)
+                    chunk = b""
+                chunk += line
+            if chunk:
+                os.write(fd, chunk)
+        finally:
+            os.close(fd)
+
+
+class SpoolSink:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def format(self, result):
+        return (
+            "### Nagios Service Check Result ###\n"
+            f"# Time: {time.ctime(result['finish'])}\n"
+            f"host_name={result['host_name']}\n"
+            f"service_description={result['service_description']}\n"
+            "check_type=1\n"
+            "check_options=0\n"
+            "scheduled_check=0\n"
+            "reschedule_check=0\n"
+            "latency=0.0\n"
+            f"start_time={result['start']:.6f}\n"
+            f"finish_time={result['finish']:.6f}\n"
+            "early_timeout=0\n"
+            "exited_ok=1\n"
+            f"return_code={result['code']}\n"
+            f"output={escape_output(result['output'])}\n"
+            "\n"
+        )
+
+    def create(self):
+        # Nagios only reads result files named c and 6 more characters, which
+        # is shorter than the names of mkstemp()
+        while True:
+            name = "c" + "".join(random.choice(SPOOL_CHARS) for _ in range(6))
+            path = os.path.join(self.directory, name)
+            try:
+                return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), path
+            except FileExistsError:
+                continue
+
+    def write(self, results):
+        # Nagios skips result files until their .ok marker exists
+        fd, path = self.create()
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(f"### Passive Check Result File ###\nfile_time={int(time.time())}\n\n")
+                f.writelines(self.format(result) for result in results)
+            os.chmod(path, 0o644)
+        except Exception:
+            os.unlink(path)
+            raise
+        with open(path + ".ok", "w"):
+            pass
+
+
+class Scheduler:
+    def __init__(self, checks, services, sink, args):
+        self.checks = checks
+        self.services = services
+        self.sink = sink
+        self.args = args
+        self.running = {}  # pipe fd -> (pid, service, start time, output chunks)
+        self.busy = set()
+        self.results = []
+        # Spread the first runs over the interval instead of starting all at once
+        now = time.monotonic()
+        self.queue = [
+            (now if args.once else now + random.uniform(0, service["interval"]), i)
+            for i, service in enumerate(services)
+        ]
+        heapq.heapify(self.queue)
+
+    def start(self, index):
+        service = self.services[index]
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # The child runs one check and reports back over the pipe
+            try:
+                os.close(read_fd)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGALRM, signal.SIG_DFL)
+                signal.alarm(self.args.timeout)
+                code, out, err = checkd.run_check(self.checks[service["check"]], service.get("args", []))
+                data = json.dumps({"code": code, "output": out.strip() or err.strip()}).encode()
+                while data:
+                    data = data[os.write(write_fd, data) :]
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        self.running[read_fd] = (pid, index, time.time(), [])
+        self.busy.add(index)
+
+    def finish(self, fd):
+        pid, index, start, chunks = self.running.pop(fd)
+        os.close(fd)
+        _, status = os.waitpid(pid, 0)
+        self.busy.discard(index)
+        service = self.services[index]
+        try:
+            reply = json.loads(b"".join(chunks))
+            code, output = reply["code"], reply["output"]
+        except ValueError:
+            if os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGALRM:
+                code, output = 3, f"UNKNOWN - Check timed out after {self.args.timeout}s"
+            else:
+                code, output = 3, f"UNKNOWN - Check died with status {status}"
+        if code not in STATES:
+            code = 3
+        logging.debug(f"{service['host_name']}/{service['service_description']}: {code} {output}")
+        self.results.append(
+            {
+                "host_name": service["host_name"],
+                "service_description": service["service_description"],
+                "code": code,
+                "output": output,
+                "start": start,
+                "finish": time.time(),
+            }
+        )
+
+    def flush(self):
+        if not self.results:
+            return
+        try:
+            self.sink.write(self.results)
+            logging.debug(f"Submitted {len(self.results)} results")
+            self.results = []
+        except OSError as ex:
+            # Keep the results for the next attempt, but not forever
+            logging.warning(f"Submitting {len(self.results)} results failed: {ex}")
+            self.results = self.results[-MAX_PENDING:]
+
+    def run(self):
+        next_flush = time.monotonic() + self.args.flush_interval
+        while self.queue or self.running:
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now and len(self.running) < self.args.max_children:
+                due, index = heapq.heappop(self.queue)
+                # A service still running from its previous turn skips this one
+                if index not in self.busy:
+                    self.start(index)
+                if not self.args.once:
+                    heapq.heappush(self.queue, (max(due + self.services[index]["interval"], now), index))
+
+            wait = next_flush - now
+            if self.queue and len(self.running) < self.args.max_children:
+                wait = min(wait, self.queue[0][0] - now)
+            if self.running:
+                readable, _, _ = select.select(list(self.running), [], [], max(0, wait))
+                for fd in readable:
+                    data = os.read(fd, 65536)
+                    if data:
+                        self.running[fd][3].append(data)
+                    else:
+                        self.finish(fd)
+            elif wait > 0:
+                time.sleep(wait)
+
+            now = time.monotonic()
+            if len(self.results) >= self.args.batch_size or now >= next_flush:
+                self.flush()
+                next_flush = now + self.args.flush_interval
+        self.flush()
+
+
+def main():
+    args = parse_args()
+
+    if args.debug:
+        logging.basicConfig(
+            format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+            level=logging.DEBUG,
+        )
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            level=logging.INFO,
+        )
+
+    with open(args.config) as f:
+        services = json.load(f)
+    checks = checkd.load_checks()
+    for service in services:
+        try:
+            check_name(service, "host_name")
+            check_name(service, "service_description")
+        except ValueError as ex:
+            logging.error(str(ex))
+            sys.exit(2)
+        name = service.get("check", "")
+        if name.endswith(".py"):
+            service["check"] = name = name[:-3]
+        if name not in checks:
+            logging.error(f"Unknown check {name} of {service.get('host_name')}/{service.get('service_description')}")
+            sys.exit(2)
+        service.setdefault("interval", args.interval)
+    sink = CommandFileSink(args.command_file) if args.command_file else SpoolSink(args.spool_dir)
+
+    scheduler = Scheduler(checks, services, sink, args)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info(f"Scheduling {len(services)} services")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
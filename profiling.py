@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# --profile FILE for the check_* scripts: main() and the threads it starts
+# run under cProfile and tracemalloc and one JSON line per run is appended to
+# FILE with the exit code, wall and CPU time, the functions with the most own
+# time, the peak of memory allocated by main() and the largest allocation
+# sites left at its end, and the time spent importing each module. Many runs
+# of many checks can share a file, `profiling.py report FILE...` sums them up
+# per check.
+# Function times are wall clock summed over all threads, waits on locks and
+# sockets included, unlike the CPU time of the run.
+#
+# The checks import this module before anything else: with --profile on the
+# command line it hooks the import system right away to time all of their
+# imports, the way -X importtime does. tracemalloc only starts with main(),
+# it would slow the imports down several times. Without --profile nothing is
+# hooked and run() just calls main(). Under checkd.py the checks are imported
+# once by the daemon, their runs have no imports to report.
+
+import sys, os, time, threading
+from contextlib import contextmanager
+
+assert sys.version_info >= (3, 7), "This script requires Python 3.7 or higher"
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+TRACE_FRAMES = 1
+
+
+def get_path(argv):
+    # FILE of --profile FILE or --profile=FILE, None without the option
+    for index, arg in enumerate(argv):
+        if arg == "--profile" and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith("--profile="):
+            return arg.partition("=")[2]
+    return None
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Append a CPU, memory and import time profile of the run to FILE as a JSON line, see profiling.py report, default value is None (no profiling)",
+    )
+
+
+class ImportTimer:
+    # Meta path finder wrapping the loaders of the other finders to time the
+    # execution of each new module, its own time without nested imports and
+    # the cumulative one including them
+    def __init__(self):
+        self.times = {}
+        self._local = threading.local()
+
+    def find_spec(self, name, path=None, target=None):
+        started = time.perf_counter()
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimedLoader(spec.loader, self, time.perf_counter() - started)
+        return spec
+
+    @contextmanager
+    def timing(self, name, found):
+        # found is the time the finders took, it counts as part of the import
+        stack = self._local.__dict__.setdefault("stack", [])
+        started = time.perf_counter()
+        stack.append(0.0)
+        try:
+            yield
+        finally:
+            cumulative = time.perf_counter() - started + found
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self.times[name] = (cumulative - nested, cumulative)
+
+
+class TimedLoader:
+    def __init__(self, loader, timer, found):
+        self.loader = loader
+        self.timer = timer
+        self.found = found
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # The module gets its own loader back, this one only lives for the import
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        with self.timer.timing(module.__name__, self.found):
+            self.loader.exec_module(module)
+
+
+_import_timer = None
+if get_path(sys.argv[1:]) is not None:
+    _import_timer = ImportTimer()
+    sys.meta_path.insert(0, _import_timer)
+
+
+def run(main):
+    # main() with --profile FILE from sys.argv honoured, SystemExit and other
+    # exceptions pass through after the profile is written
+    path = get_path(sys.argv[1:])
+    if path is None:
+        return main()
+    import cProfile, tracemalloc
+
+    tracemalloc.start(TRACE_FRAMES)
+    profile = cProfile.Profile()
+    threads = profile_threads(cProfile)
+    started, cpu = time.perf_counter(), time.process_time()
+    code, error = 0, None
+    try:
+        return profile.runcall(main)
+    except SystemExit as ex:
+        code = ex.code if isinstance(ex.code, int) or ex.code is None else 1
+        raise
+    except BaseException as ex:
+        code, error = 1, f"{type(ex).__name__}: {ex}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - started, time.process_time() - cpu
+        threading.setprofile(None)
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        if _import_timer is not None and _import_timer in sys.meta_path:
+            sys.meta_path.remove(_import_timer)
+        record = {
+            "time": time.time(),
+            "check": os.path.basename(sys.argv[0]),
+            "argv": sys.argv[1:],
+            "exit": code or 0,
+            "error": error,
+            "wall": wall,
+            "cpu": cpu,
+            "threads": len(threads),
+            "functions": get_functions([profile] + threads),
+            "memory": {"peak": peak, "top": get_allocations(snapshot)},
+            "imports": get_imports(),
+        }
+        write(path, record)
+
+
+def profile_threads(cProfile):
+    # A cProfile profiler follows the thread that enables it only, so every
+    # thread started from now on, like the fetches of the upstream quorum or
+    # of check_decimalchain.py, enables one of its own on its first event.
+    # Returns the list they are added to.
+    profiles = []
+
+    def start(frame, event, arg):
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        profile.enable()
+
+    threading.setprofile(start)
+    return profiles
+
+
+def get_functions(profiles):
+    # Top functions summed over the profiles of all threads. Threads still
+    # running, e.g. left behind by the quorum, contribute what they did so far.
+    import pstats
+
+    stats = pstats.Stats(*profiles).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+    return [
+        {"function": f"{filename}:{line}({name})", "calls": calls, "own": own, "cumulative": cumulative}
+        for (filename, line, name), (_, calls, own, cumulative, _) in functions
+    ]
+
+
+def get_allocations(snapshot):
+    import tracemalloc
+
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+def get_imports():
+    if _import_timer is None:
+        return []
+    imports = sorted(_import_timer.times.items(), key=lambda item: item[1][0], reverse=True)
+    return [{"module": name, "own": own, "cumulative": cumulative} for name, (own, cumulative) in imports]
+
+
+def write(path, record):
+    # A single write() to an O_APPEND file, lines of concurrent checks don't mix
+    import json
+
+    line = (json.dumps(record) + "\n").encode()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as ex:
+        print(f"Failed to write profile to {path}: {ex}", file=sys.stderr)
+
+
+def load(paths):
+    import json
+
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    runs.append(json.loads(line))
+    return runs
+
+
+def mean(values):
+    values = list(values)
+    return sum(values) / len(values) if values else 0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def add_up(runs, section, key, value):
+    # {key: mean value per run} of the entries of one section over all runs
+    totals = {}
+    for run in runs:
+        for entry in section(run):
+            totals[entry[key]] = totals.get(entry[key], 0) + entry[value]
+    return {name: total / len(runs) for name, total in totals.items()}
+
+
+def report(runs, top=10):
+    lines = []
+    checks = {}
+    for run in runs:
+        checks.setdefault(run["check"], []).append(run)
+    for check, check_runs in sorted(checks.items()):
+        walls = [run["wall"] for run in check_runs]
+        exits = {}
+        for run in check_runs:
+            exits[run["exit"]] = exits.get(run["exit"], 0) + 1
+        lines.append(
+            f"{check}: {len(check_runs)} runs, "
+            f"wall mean {mean(walls) * 1000:.1f}ms p95 {percentile(walls, 0.95) * 1000:.1f}ms, "
+            f"CPU mean {mean(run['cpu'] for run in check_runs) * 1000:.1f}ms, "
+            f"peak memory mean {mean(run['memory']['peak'] for run in check_runs) / 1024:.0f}KiB, "
+            f"exit codes {', '.join(f'{code}: {count}' for code, count in sorted(exits.items()))}"
+        )
+        sections = [
+            ("functions by own time", lambda run: run["functions"], "function", "own", "ms", 1000),
+            ("imports by own time", lambda run: run["imports"], "module", "own", "ms", 1000),
+            ("allocations left at the end", lambda run: run["memory"]["top"], "location", "size", "KiB", 1 / 1024),
+        ]
+        for title, section, key, value, unit, scale in sections:
+            means = add_up(check_runs, section, key, value)
+            if not means:
+                continue
+            lines.append(f"  top {title}, mean per run:")
+            for name, total in sorted(means.items(), key=lambda item: item[1], reverse=True)[:top]:
+                lines.append(f"    {total * scale:10.3f}{unit}  {name}")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aggregate report of the profiles written by the checks with --profile")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    report_parser = subparsers.add_parser("report", help="Sum up the runs in the given profile files per check")
+    report_parser.add_argument("files", nargs="+", help="Files written with --profile")
+    report_parser.add_argument(
+        "-n", "--top", type=int, default=10, help="Amount of functions, imports and allocations to list per check, default value is 10"
+    )
+    args = parser.parse_args()
+
+    runs = load(args.files)
+    if not runs:
+        print("No runs recorded")
+        sys.exit(1)
+    print(report(runs, args.top))
+
+
+if __name__ == "__main__":
+    main()
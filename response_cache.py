@@ -0,0 +1,129 @@
+# On-disk cache of HTTP responses shared by all check processes of a host.
+# Services that poll the same endpoint within seconds of each other, e.g.
+# check_decimalchain_node and check_decimalchain_validator both reading
+# /status, get the answer of whichever ran first. A miss is fetched by one
+# process while the others wait on the entry's lock, like upstream_cache.py.
+# Entries are keyed by method, URL and request body; the oldest are evicted
+# once the cache grows over NAGIOS_CHECKS_CACHE_SIZE bytes.
+
+import os, json, time, base64, logging
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import deadline
+import statefile
+
+MAX_SIZE = int(os.environ.get("NAGIOS_CHECKS_CACHE_SIZE", 64 << 20))
+
+
+def parse_ttl(value):
+    # "2" for every endpoint, "net_info=10" for one of them
+    endpoint, _, seconds = value.rpartition("=")
+    return endpoint or None, float(seconds)
+
+
+def add_arguments(parser, endpoints):
+    parser.add_argument(
+        "--cache-ttl",
+        type=parse_ttl,
+        action="append",
+        default=[],
+        help=f"Seconds to share responses of the node with other checks on this host, for all endpoints or as ENDPOINT=SECONDS "
+        f"with ENDPOINT one of {', '.join(endpoints)}, can be specified multiple times, e.g. --cache-ttl 2 --cache-ttl {endpoints[-1]}=10, "
+        "default value is 0 (no caching)",
+    )
+
+
+def get_ttl(args, endpoint):
+    ttl = 0
+    for name, seconds in args.cache_ttl:
+        if name is None:
+            ttl = seconds
+    for name, seconds in args.cache_ttl:
+        if name == endpoint:
+            ttl = seconds
+    return ttl
+
+
+def get_key(method, url, kwargs):
+    body = kwargs.get("json")
+    if body is not None:
+        body = json.dumps(body, sort_keys=True)
+    else:
+        body = kwargs.get("data") or ""
+        if isinstance(body, bytes):
+            body = body.decode(errors="replace")
+    return f"{method} {url} {body}"
+
+
+def load(entry, url):
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.url = url
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = base64.b64decode(entry["body"])
+    response._content_consumed = True
+    return response
+
+
+def dump(response):
+    return {
+        "time": time.time(),
+        "status": response.status_code,
+        "headers": {name: value for name, value in response.headers.items() if name.lower() == "content-type"},
+        "body": base64.b64encode(response.content).decode(),
+    }
+
+
+def get(method, url, kwargs, ttl, fetch):
+    # Response from the cache when it is younger than ttl, otherwise from
+    # fetch(), which only one process runs at a time per entry. Only 200
+    # answers are kept, failures are for breaker.py to remember.
+    path = statefile.state_path("responses", get_key(method, url, kwargs))
+    entry = statefile.read_json(path)
+    if entry is not None and time.time() - entry["time"] < ttl:
+        return load(entry, url)
+    # Under a --deadline the wait for another process' fetch is bounded by
+    # what is left of it, that fetch may run on a longer fixed timeout
+    try:
+        with statefile.locked(path, timeout=deadline.timeout()):
+            entry = statefile.read_json(path)
+            if entry is not None and time.time() - entry["time"] < ttl:
+                return load(entry, url)
+            response = fetch()
+            if response.status_code == 200:
+                statefile.write_json(path, dump(response))
+                evict(os.path.dirname(path))
+    except statefile.LockTimeout:
+        raise deadline.exceeded() from None
+    return response
+
+
+def evict(directory, max_size=MAX_SIZE):
+    # Removes the oldest entries until the cache is under 3/4 of max_size
+    entries = []
+    total = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".lock") or entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_size:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size * 3 // 4:
+            break
+        # Lock files stay, a process may hold one right now
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    logging.debug(f"response cache evicted down to {total} bytes")
@@ -0,0 +1,67 @@
+# Dependency-free parser for the RFC3339 timestamps Tendermint returns, e.g.
+# 2023-05-01T12:34:56.123456789Z, keeping the full nanosecond precision.
+
+import re, time, calendar
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_RFC3339 = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[Tt ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?(?:[Zz]|([+-])(\d{2}):(\d{2}))$"
+)
+
+
+def _days_from_civil(year, month, day):
+    # Days since 1970-01-01 in the proleptic Gregorian calendar
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def parse_ns(value):
+    # Returns nanoseconds since the Unix epoch, UTC
+    match = _RFC3339.match(value)
+    if match is None:
+        raise ValueError(f"Invalid RFC3339 timestamp: {value!r}")
+    year, month, day, hour, minute, second, fraction, sign, off_hour, off_minute = match.groups()
+    year, month, day = int(year), int(month), int(day)
+    # Second 60 is a leap second, it counts as the first one of the next minute
+    if not (
+        year >= 1
+        and 1 <= month <= 12
+        and 1 <= day <= calendar.monthrange(year, month)[1]
+        and int(hour) <= 23
+        and int(minute) <= 59
+        and int(second) <= 60
+        and (not sign or (int(off_hour) <= 23 and int(off_minute) <= 59))
+    ):
+        raise ValueError(f"Invalid RFC3339 timestamp: {value!r}")
+    seconds = (
+        _days_from_civil(year, month, day) * 86400
+        + int(hour) * 3600
+        + int(minute) * 60
+        + int(second)
+    )
+    if sign:
+        offset = int(off_hour) * 3600 + int(off_minute) * 60
+        seconds += -offset if sign == "+" else offset
+    nanos = int((fraction + "000000000")[:9]) if fraction else 0
+    return seconds * 1000000000 + nanos
+
+
+def to_datetime(ns):
+    return EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def parse(value):
+    # Returns an aware UTC datetime, truncated to microseconds
+    return to_datetime(parse_ns(value))
+
+
+def parse_age(value):
+    # Returns (aware UTC datetime of the timestamp, timedelta from it to now)
+    ns = parse_ns(value)
+    return to_datetime(ns), timedelta(microseconds=(time.time_ns() - ns) // 1000)
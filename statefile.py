@@ -0,0 +1,65 @@
+# Small helpers for state shared between check processes: JSON files in a
+# common directory, written atomically and guarded by flock()ed lock files.
+
+import os, re, json, time, fcntl, hashlib, tempfile
+from contextlib import contextmanager
+
+STATE_DIR = os.environ.get("NAGIOS_CHECKS_STATE_DIR", "/var/tmp/nagios_scripts")
+LOCK_POLL = 0.02
+
+
+class LockTimeout(Exception):
+    pass
+
+
+def state_path(kind, key):
+    # Keep the key readable in the file name, the hash keeps it unique
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", key).strip("_")[:64]
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    directory = os.path.join(STATE_DIR, kind)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}-{digest}")
+
+
+@contextmanager
+def locked(path, exclusive=True, timeout=None):
+    # With a timeout the lock is polled for and LockTimeout raised when it is
+    # still taken after that many seconds, without one it waits for good
+    with open(path + ".lock", "a") as lock:
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if timeout is None:
+            fcntl.flock(lock, operation)
+        else:
+            until = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock, operation | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= until:
+                        raise LockTimeout(f"{path} still locked after {timeout:.2f}s") from None
+                    time.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,80 @@
+# Network timing of the requests of a check: DNS, TCP connect, TLS
+# handshake, time to first byte, body transfer and JSON decoding, plus the
+# body size. transport.py fills in one record per request and the checks
+# append the totals as perfdata and log the single requests with --debug.
+#
+# Requests are labelled with the deadline phase they run in, e.g. status or
+# upstream, or with the host and port they go to outside of any phase, like
+# the requests of the upstream quorum, so slow upstreams show by name.
+
+import re, time, logging, threading
+from collections import deque
+from contextlib import contextmanager
+
+PHASES = ("dns", "connect", "tls", "ttfb", "body", "json")
+
+# Bounded, resident users like the exporter never report them
+_records = deque(maxlen=256)
+_local = threading.local()
+
+
+def start(method, url, label):
+    # New record, current for this thread until finish()
+    record = dict({phase: 0.0 for phase in PHASES}, label=label, method=method, url=url, bytes=0)
+    _records.append(record)
+    _local.record = record
+    return record
+
+
+def finish():
+    _local.record = None
+
+
+def current():
+    return getattr(_local, "record", None)
+
+
+@contextmanager
+def decoding(record):
+    # Time spent in the block counts as JSON decoding, except for the waits
+    # for body chunks in it, for checks that parse a streamed body
+    started, waited = time.monotonic(), record["body"]
+    try:
+        yield
+    finally:
+        record["json"] += time.monotonic() - started - (record["body"] - waited)
+
+
+def totals():
+    # {label: {phase: seconds, "bytes": n}} over all requests
+    result = {}
+    for record in list(_records):
+        total = result.setdefault(record["label"], dict({phase: 0.0 for phase in PHASES}, bytes=0, https=False))
+        for phase in PHASES:
+            total[phase] += record[phase]
+        total["bytes"] += record["bytes"]
+        total["https"] |= record["url"].startswith("https://")
+    return result
+
+
+def perfdata():
+    values = []
+    for label, total in totals().items():
+        label = re.sub(r"[^A-Za-z0-9_.:-]+", "_", label)
+        for phase in PHASES:
+            if phase == "tls" and not total["https"]:
+                continue
+            values.append(f"{label}_{phase}={total[phase]:.6f}s")
+        values.append(f"{label}_size={total['bytes']}B")
+    return " ".join(values)
+
+
+def append_perfdata(message):
+    values = perfdata()
+    return f"{message} | {values}" if values else message
+
+
+def log():
+    for record in list(_records):
+        phases = ", ".join(f"{phase} {record[phase] * 1000:.1f}ms" for phase in PHASES)
+        logging.debug(f"{record['label']}: {record['method']} {record['url']}: {phases}, {record['bytes']} bytes")
@@ -0,0 +1,246 @@
+# Shared HTTP transport of the checks: one keep-alive requests.Session per
+# scheme://host:port, so every request to a host after the first one in a
+# process reuses an open connection instead of paying DNS, TCP and TLS again,
+# plus a process-wide cache of DNS answers. Resident and batch users (the
+# exporter, the block tracker, --hosts runs, checks with several requests
+# per host) get the savings; stats() reports how many requests went over
+# how many connections.
+#
+# Under a --deadline (see deadline.py) request timeouts are capped to what is
+# left of it and bodies are read chunk by chunk, so a server trickling its
+# answer can't keep the check past the deadline either. Origins that keep
+# failing are short-circuited by breaker.py, and callers passing cache_ttl
+# share responses through response_cache.py.
+#
+# Every request sent records its DNS, connect, TLS, time to first byte, body
+# and JSON decoding times and its size, see timing.py. Responses served from
+# the response cache don't, they cost no network time.
+
+import os, socket, threading, time, logging
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3.connection
+import urllib3.connectionpool
+
+import breaker
+import deadline
+import response_cache
+import timing
+
+DNS_TTL = float(os.environ.get("NAGIOS_CHECKS_DNS_TTL", 60))
+POOL_SIZE = 16
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_getaddrinfo = socket.getaddrinfo
+
+
+def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    started = time.monotonic()
+    try:
+        return resolve(host, port, family, type, proto, flags)
+    finally:
+        record = timing.current()
+        if record is not None:
+            record["dns"] += time.monotonic() - started
+
+
+def resolve(host, port, family=0, type=0, proto=0, flags=0):
+    if DNS_TTL <= 0:
+        return _getaddrinfo(host, port, family, type, proto, flags)
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+    if entry is not None and now - entry[0] < DNS_TTL:
+        return entry[1]
+    # Resolve outside of the lock, a slow name must not block the others
+    result = _getaddrinfo(host, port, family, type, proto, flags)
+    with _dns_lock:
+        _dns_cache[key] = (now, result)
+    return result
+
+
+socket.getaddrinfo = cached_getaddrinfo
+
+
+class TimedConnection:
+    # Connect time of the request being sent, without the DNS lookup in it
+    def _new_conn(self):
+        record = timing.current()
+        if record is None:
+            return super()._new_conn()
+        started, dns = time.monotonic(), record["dns"]
+        try:
+            return super()._new_conn()
+        finally:
+            record["connect"] += time.monotonic() - started - (record["dns"] - dns)
+
+
+# Named like the urllib3 classes, they show in connection error messages
+class HTTPConnection(TimedConnection, urllib3.connection.HTTPConnection):
+    pass
+
+
+class HTTPSConnection(TimedConnection, urllib3.connection.HTTPSConnection):
+    def connect(self):
+        # Everything after the TCP connection is the TLS handshake
+        record = timing.current()
+        if record is None:
+            return super().connect()
+        started, before = time.monotonic(), record["dns"] + record["connect"]
+        try:
+            return super().connect()
+        finally:
+            record["tls"] += time.monotonic() - started - (record["dns"] + record["connect"] - before)
+
+
+class HTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = HTTPConnection
+
+
+class HTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+    ConnectionCls = HTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": HTTPConnectionPool, "https": HTTPSConnectionPool}
+
+
+def get_origin(url):
+    parsed = urllib.parse.urlsplit(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return f"{parsed.scheme}://{parsed.hostname}:{port}"
+
+
+def get_session(url):
+    origin = get_origin(url)
+    with _sessions_lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = requests.Session()
+            # One origin per session, the pool size bounds concurrent requests
+            adapter = TimedAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[origin] = session
+    return session
+
+
+def request(method, url, cache_ttl=0, **kwargs):
+    # cache_ttl > 0 shares the answer with other processes for that long,
+    # see response_cache.py
+    if cache_ttl > 0 and not kwargs.get("stream"):
+        return response_cache.get(method, url, kwargs, cache_ttl, lambda: request(method, url, **kwargs))
+    origin = get_origin(url)
+    breaker.before(origin)
+    try:
+        response = send(method, url, **kwargs)
+    except requests.RequestException as ex:
+        # A timeout cut short by the deadline is the deadline's failure
+        deadline.check()
+        breaker.failure(origin, ex)
+        raise
+    breaker.success(origin)
+    return response
+
+
+def send(method, url, **kwargs):
+    # Bodies are always streamed here to time their transfer apart from the
+    # wait for the first byte, callers asking for stream=True read them with
+    # iter_body()
+    kwargs["timeout"] = deadline.timeout(kwargs.get("timeout"))
+    stream = kwargs.get("stream", False)
+    kwargs["stream"] = True
+    record = timing.start(method, url, deadline.current() or urllib.parse.urlsplit(url).netloc)
+    started = time.monotonic()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    finally:
+        timing.finish()
+        # A failed request shows how long it waited as its time to first byte
+        record["ttfb"] = max(0, time.monotonic() - started - record["dns"] - record["connect"] - record["tls"])
+    response.timing = record
+    decode = response.json
+
+    def json(**kwargs):
+        started = time.monotonic()
+        try:
+            return decode(**kwargs)
+        finally:
+            record["json"] += time.monotonic() - started
+
+    response.json = json
+    if not stream:
+        with response:
+            response._content = b"".join(iter_body(response))
+    return response
+
+
+def iter_body(response, chunk_size=65536):
+    # Chunks of a streamed body, stopped once the deadline has passed, with
+    # their size and the time waited for them added to the request's timing
+    record = getattr(response, "timing", None)
+    chunks = response.iter_content(chunk_size)
+    while True:
+        started = time.monotonic()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            if record is not None:
+                record["body"] += time.monotonic() - started
+        deadline.check()
+        if record is not None:
+            record["bytes"] += len(chunk)
+        yield chunk
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def stats():
+    # {origin: {"requests": n, "connections": n}} from the urllib3 pools
+    result = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for origin, session in sessions.items():
+        counts = result.setdefault(origin, {"requests": 0, "connections": 0})
+        for adapter in set(session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                counts["requests"] += pool.num_requests
+                counts["connections"] += pool.num_connections
+    return result
+
+
+def describe(counts):
+    reused = counts["requests"] - counts["connections"]
+    ratio = reused / counts["requests"] * 100 if counts["requests"] else 0
+    return f"{counts['requests']} requests over {counts['connections']} connections, {ratio:.0f}% reused"
+
+
+def log_stats():
+    for origin, counts in sorted(stats().items()):
+        logging.debug(f"{origin}: {describe(counts)}")
+    timing.log()
+
+
+def close():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,41 @@
+# On-disk cache of upstream block heights shared by all check processes.
+# Concurrent checks of the same upstream wait on the entry's lock while one
+# of them fetches, then reuse its result until the TTL expires.
+
+import time
+import deadline
+from statefile import LockTimeout, state_path, locked, read_json, write_json
+
+
+def get_height(url, fetch, ttl):
+    # Returns (height, info) where info tells whether the value came from the
+    # cache and how old it is. fetch() is only called on a miss.
+    if ttl <= 0:
+        return fetch(), {"hit": False, "age": 0.0}
+
+    path = state_path("upstream", url)
+    entry = read_json(path)
+    now = time.time()
+    if entry is not None and now - entry["time"] < ttl:
+        return entry["height"], {"hit": True, "age": now - entry["time"]}
+
+    # Under a --deadline the wait for another process' fetch is bounded by
+    # what is left of it, like in response_cache.py
+    try:
+        with locked(path, timeout=deadline.timeout()):
+            entry = read_json(path)
+            now = time.time()
+            if entry is not None and now - entry["time"] < ttl:
+                return entry["height"], {"hit": True, "age": now - entry["time"]}
+            height = fetch()
+            write_json(path, {"height": height, "time": time.time()})
+    except LockTimeout:
+        raise deadline.exceeded() from None
+
+    return height, {"hit": False, "age": 0.0}
+
+
+def describe(info):
+    if info["hit"]:
+        return f"upstream cache hit, age {info['age']:.1f}s"
+    return "upstream cache miss"
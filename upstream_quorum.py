@@ -0,0 +1,149 @@
+# Reference block height from several upstreams with hedged requests. The
+# first --quorum upstreams are asked at once, the others only when one of
+# them fails or hasn't answered after --hedge-after seconds. The median of
+# the first --quorum heights is used, or of whatever answered within
+# --upstream-budget, so a slow or dead upstream costs at most the budget and
+# a single lagging or runaway one can't move the result.
+
+import time, queue, statistics, threading
+import deadline
+import upstream_cache
+
+TIMEOUT_GRACE = 0.2
+
+
+def add_arguments(parser, defaults, budget):
+    parser.set_defaults(default_upstreams=list(defaults))
+    parser.add_argument(
+        "-U",
+        "--upstream",
+        action="append",
+        help=f"Upstream node to compare with, can be comma separated or specified multiple times, earlier ones are asked first, default value is {','.join(defaults)}",
+    )
+    parser.add_argument(
+        "--quorum",
+        type=int,
+        default=2,
+        help="Amount of upstream answers to wait for, at most the amount of upstreams, default value is 2",
+    )
+    parser.add_argument(
+        "--upstream-budget",
+        type=float,
+        default=budget,
+        help=f"Seconds to wait for upstream answers, also the timeout of each request, default value is {budget}",
+    )
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        default=1,
+        help="Seconds after which the remaining upstreams are asked too, default value is 1",
+    )
+
+
+def get_upstreams(args):
+    if not args.upstream:
+        return list(args.default_upstreams)
+    return [upstream.strip() for value in args.upstream for upstream in value.split(",") if upstream.strip()]
+
+
+def get_height(upstreams, fetch, quorum=2, budget=5, hedge_after=1):
+    # fetch(upstream, timeout) returns a height or raises, timeout is what is
+    # left of the budget. Returns the median height
+    # and {"asked", "heights", "errors"}. Requests run in daemon threads, the
+    # ones still out when the quorum is reached are left behind.
+    upstreams = list(dict.fromkeys(upstreams))
+    quorum = max(1, min(quorum, len(upstreams)))
+    results = queue.Queue()
+    waiting = list(upstreams)
+    asked = []
+
+    def ask(count):
+        for upstream in waiting[:count]:
+            threading.Thread(target=request, args=(upstream,), daemon=True).start()
+            asked.append(upstream)
+        del waiting[:count]
+
+    def request(upstream):
+        try:
+            results.put((upstream, fetch(upstream, max(0.1, until - time.monotonic())), None))
+        except Exception as ex:
+            results.put((upstream, None, ex))
+
+    started = time.monotonic()
+    until = started + budget
+    hedge_at = started + hedge_after
+    heights, errors = {}, {}
+    ask(quorum)
+    while len(heights) < quorum and len(heights) + len(errors) < len(upstreams):
+        now = time.monotonic()
+        if now >= until:
+            break
+        if waiting and now >= hedge_at:
+            ask(len(waiting))
+        try:
+            upstream, height, error = results.get(timeout=min(until, hedge_at if waiting else until) - now)
+        except queue.Empty:
+            continue
+        if error is None:
+            heights[upstream] = int(height)
+        else:
+            errors[upstream] = error
+            # Replace a failed upstream right away instead of waiting to hedge
+            ask(1)
+    if time.monotonic() >= until:
+        # Requests still out time out together with the budget, a moment
+        # lets them fail properly and the circuit breaker count them
+        grace = time.monotonic() + TIMEOUT_GRACE
+        while len(heights) + len(errors) < len(asked) and time.monotonic() < grace:
+            try:
+                upstream, height, error = results.get(timeout=grace - time.monotonic())
+            except queue.Empty:
+                break
+            if error is None:
+                heights[upstream] = int(height)
+            else:
+                errors[upstream] = error
+    if not heights:
+        deadline.check()
+        details = "; ".join(f"{upstream}: {error}" for upstream, error in errors.items())
+        if len(errors) == len(upstreams):
+            raise RuntimeError(f"All upstreams failed: {details}")
+        raise RuntimeError(f"No upstream answered within {budget}s" + (f" ({details})" if details else ""))
+    # median_low keeps the reference a height some upstream actually reported
+    info = {"asked": len(asked), "heights": heights, "errors": {u: str(e) for u, e in errors.items()}}
+    return statistics.median_low(heights.values()), info
+
+
+def get_cached_height(upstreams, fetch, ttl, quorum=2, budget=5, hedge_after=1):
+    # get_height() behind the upstream cache, shared by all checks asking the
+    # same upstreams. Returns (height, cache info, quorum info or None on a hit)
+    info = {}
+
+    def fetch_quorum():
+        height, quorum_info = get_height(upstreams, fetch, quorum, budget, hedge_after)
+        info.update(quorum_info)
+        return height
+
+    height, cache_info = upstream_cache.get_height(",".join(sorted(upstreams)), fetch_quorum, ttl)
+    return height, cache_info, info or None
+
+
+def get_args_height(args, fetch):
+    # get_cached_height() with the options of add_arguments(), the budget
+    # capped to what is left of the --deadline
+    with deadline.phase("upstream"):
+        return get_cached_height(
+            get_upstreams(args),
+            fetch,
+            args.upstream_ttl,
+            args.quorum,
+            deadline.timeout(args.upstream_budget),
+            args.hedge_after,
+        )
+
+
+def describe(cache_info, info):
+    result = upstream_cache.describe(cache_info)
+    if info is not None and info["asked"] > 1:
+        result += f", {len(info['heights'])} of {info['asked']} upstreams answered"
+    return result